@@ -0,0 +1 @@
+"""Offline benchmarks for the YOLOv3 detection pipeline"""
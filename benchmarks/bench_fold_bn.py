@@ -0,0 +1,66 @@
+"""
+BatchNormalization folding: numerical equivalence and forward latency against the unfolded body
+
+    python -m benchmarks.bench_fold_bn --model yolo --size 416
+
+Runs on random weights with random BatchNormalization statistics, so nothing is
+downloaded. Exits with status 1 when the folded outputs differ by more than --rtol
+times the largest output.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from .suite import measure
+from .synthetic import ANCHORS, TINY_ANCHORS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', choices=['yolo', 'tiny'], default='yolo')
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--num-classes', type=int, default=80)
+    parser.add_argument('--iterations', '-n', type=int, default=20)
+    parser.add_argument('--rtol', type=float, default=1e-4,
+                        help='Largest allowed output difference, relative to the largest output')
+    args = parser.parse_args()
+
+    from keras import backend as K
+    from keras.layers import Input, BatchNormalization
+    from models.keras_yolov3.src.yolo3.model import yolo_body, tiny_yolo_body, fold_batch_norms
+
+    K.set_learning_phase(0)
+    anchors = TINY_ANCHORS if args.model == 'tiny' else ANCHORS
+    num_anchors = len(anchors) // (2 if args.model == 'tiny' else 3)
+    body = tiny_yolo_body if args.model == 'tiny' else yolo_body
+    model = body(Input(shape=(None, None, 3)), num_anchors, args.num_classes)
+    rng = np.random.RandomState(0)
+    for layer in model.layers:
+        if isinstance(layer, BatchNormalization):
+            channels = layer.get_weights()[0].shape
+            layer.set_weights([rng.uniform(.5, 1.5, channels), rng.normal(0, .1, channels),
+                               rng.normal(0, .1, channels), rng.uniform(.5, 1.5, channels)])
+    fused = fold_batch_norms(model, num_anchors, args.num_classes)
+
+    sess = K.get_session()
+    images = rng.uniform(0, 1, (args.batch, args.size, args.size, 3)).astype('float32')
+    outputs = sess.run(model.output, feed_dict={model.input: images})
+    fused_outputs = sess.run(fused.output, feed_dict={fused.input: images})
+    max_diff = max(float(np.abs(a - b).max()) for a, b in zip(outputs, fused_outputs))
+    scale = max(float(np.abs(a).max()) for a in outputs)
+    print('max abs difference {:.3g} (outputs up to {:.3g})'.format(max_diff, scale))
+
+    count = sum(isinstance(layer, BatchNormalization) for layer in model.layers)
+    for name, m in (('unfolded', model), ('folded', fused)):
+        latencies = measure(lambda: sess.run(m.output, feed_dict={m.input: images}), 2, args.iterations)
+        print('{:<9} {:>3} BN layers  median {:8.2f} ms  p90 {:8.2f} ms'.format(
+            name, count if m is model else 0, np.median(latencies) * 1e3, np.percentile(latencies, 90) * 1e3))
+    if max_diff > args.rtol * max(scale, 1.):
+        print('FAILED: folded outputs differ by more than {} relative'.format(args.rtol))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Import-time budget check based on `python -X importtime`
+
+Each module is imported in a fresh interpreter. The check fails (exit status 1)
+when a module takes longer than its budget, or pulls in a dependency that
+should only be loaded on first use.
+"""
+import argparse
+import subprocess
+import sys
+
+# module: (budget in ms, modules that must not be imported as a side effect)
+BUDGETS = {
+    'util': (500, ('tensorflow', 'requests')),
+    'models.keras_yolov3': (20, ('tensorflow', 'keras', 'cv2', 'PIL')),
+    'models.keras_yolov3.src.yolo3.utils': (300, ('tensorflow', 'keras', 'cv2', 'matplotlib')),
+    'models.keras_yolov3.src.yolo3.postprocess': (300, ('tensorflow', 'keras', 'cv2', 'PIL')),
+}
+
+
+def import_time(module):
+    """
+    Import `module` in a fresh interpreter
+    Returns:
+        tuple: total import time in ms, {imported module name: self time in ms}
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            stderr=subprocess.PIPE, check=True).stderr.decode()
+    self_times = {}
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self_times[name.strip()] = int(self_us) / 1e3
+        # The target and its parent packages appear unindented, with everything they pull in beneath them.
+        if name.strip() == module or module.startswith(name.strip() + '.'):
+            total_us += int(cumulative_us)
+    return total_us / 1e3, self_times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=sorted(BUDGETS), help='Modules to check (default: all budgets)')
+    parser.add_argument('--top', type=int, default=5, help='Slowest imports to list per module')
+    args = parser.parse_args()
+    failed = False
+    for module in args.modules:
+        budget, forbidden = BUDGETS.get(module, (float('inf'), ()))
+        total, self_times = import_time(module)
+        leaked = [name for name in forbidden if name in self_times]
+        ok = total <= budget and not leaked
+        failed |= not ok
+        print('{:<45} {:8.1f} ms (budget {:.0f} ms) {}'.format(module, total, budget, 'ok' if ok else 'FAIL'))
+        if leaked:
+            print('    imports deferred dependencies: {}'.format(', '.join(leaked)))
+        for name, ms in sorted(self_times.items(), key=lambda item: -item[1])[:args.top]:
+            print('    {:8.1f} ms  {}'.format(ms, name))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
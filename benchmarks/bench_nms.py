@@ -0,0 +1,97 @@
+"""Benchmark `yolo_eval` NMS modes: graph construction time, run latency and output agreement
+
+Both modes are also built for batches, as `YOLO` builds them, and run on two
+images of different sizes; every image must get the boxes it gets on its own.
+
+With --classes, each mode is also run with a class mask keeping that many classes, which must return
+exactly the unfiltered boxes of those classes.
+"""
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+
+from models.keras_yolov3.src.yolo3.model import yolo_eval
+from .synthetic import ANCHORS, random_head_outputs
+
+def as_set(boxes, scores, classes):
+    return sorted((int(c), round(float(s), 4)) + tuple(np.round(b, 2)) for b, s, c in zip(boxes, scores, classes))
+
+
+def as_sets(boxes, scores, classes, batch_index, batch_size):
+    """One `as_set` per image of a batched run"""
+    return [as_set(boxes[batch_index == b], scores[batch_index == b], classes[batch_index == b])
+            for b in range(batch_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', '-n', type=int, default=50, help='Runs to time per mode')
+    parser.add_argument('--size', type=int, default=416, help='Model input size (default=416)')
+    parser.add_argument('--num-classes', type=int, default=80)
+    parser.add_argument('--score', type=float, default=0.3)
+    parser.add_argument('--classes', type=int, default=None, help='Classes kept by the class mask run')
+    args = parser.parse_args()
+    rng = np.random.RandomState(0)
+    inputs = [K.placeholder(shape=(None, None, None, 3 * (args.num_classes + 5))) for _ in range(3)]
+    image_shape = K.placeholder(shape=(2,))
+    image_shapes = K.placeholder(shape=(None, 2))
+    batch_shapes = [[480, 640], [720, 1280]]
+    class_mask = tf.placeholder_with_default(np.ones(args.num_classes, dtype='float32'), shape=(args.num_classes,))
+    sess = K.get_session()
+    feeds = [random_head_outputs(args.size, args.num_classes, rng) for _ in range(4)]
+    batch_feed = random_head_outputs(args.size, args.num_classes, rng, batch_size=len(batch_shapes))
+    results = {}
+    batch_results = {}
+    for nms_mode in ('per_class', 'offset'):
+        ops_before = len(tf.get_default_graph().get_operations())
+        start = timer()
+        # max_boxes is large enough that neither mode hits its cap, so outputs must match exactly.
+        fetches = yolo_eval(inputs, ANCHORS, args.num_classes, image_shape, max_boxes=1000,
+                            score_threshold=args.score, iou_threshold=0.45, nms_mode=nms_mode,
+                            pre_nms_top_k=100000, class_mask=class_mask)
+        build_time = timer() - start
+        num_ops = len(tf.get_default_graph().get_operations()) - ops_before
+        sess.run(fetches, feed_dict=dict(zip(inputs, feeds[0]), **{image_shape: [480, 640]}))
+        start = timer()
+        for i in range(args.iterations):
+            sess.run(fetches, feed_dict=dict(zip(inputs, feeds[i % len(feeds)]), **{image_shape: [480, 640]}))
+        run_time = (timer() - start) / args.iterations
+        results[nms_mode] = [as_set(*sess.run(fetches, feed_dict=dict(zip(inputs, feed), **{image_shape: [480, 640]})))
+                             for feed in feeds]
+        print('{:<10} build {:7.1f} ms  graph ops {:6d}  run {:7.2f} ms'.format(
+            nms_mode, build_time * 1e3, num_ops, run_time * 1e3))
+        if args.classes is not None:
+            mask = (np.arange(args.num_classes) < args.classes).astype('float32')
+            start = timer()
+            for i in range(args.iterations):
+                sess.run(fetches, feed_dict=dict(zip(inputs, feeds[i % len(feeds)]),
+                                                 **{image_shape: [480, 640], class_mask: mask}))
+            run_time = (timer() - start) / args.iterations
+            filtered = [as_set(*sess.run(fetches, feed_dict=dict(zip(inputs, feed),
+                                                                 **{image_shape: [480, 640], class_mask: mask})))
+                        for feed in feeds]
+            assert filtered == [[box for box in boxes if box[0] < args.classes] for boxes in results[nms_mode]], \
+                'Class mask changes the kept boxes'
+            print('{:<10} {} classes                     run {:7.2f} ms'.format(
+                nms_mode, args.classes, run_time * 1e3))
+
+        batch_fetches = yolo_eval(inputs, ANCHORS, args.num_classes, image_shapes, max_boxes=1000,
+                                  score_threshold=args.score, iou_threshold=0.45, nms_mode=nms_mode,
+                                  pre_nms_top_k=100000)
+        batch_results[nms_mode] = as_sets(*sess.run(batch_fetches, feed_dict=dict(
+            zip(inputs, batch_feed), **{image_shapes: batch_shapes})), batch_size=len(batch_shapes))
+        single = [as_set(*sess.run(fetches, feed_dict=dict(zip(inputs, [feed[b:b + 1] for feed in batch_feed]),
+                                                           **{image_shape: shape})))
+                  for b, shape in enumerate(batch_shapes)]
+        assert batch_results[nms_mode] == single, '{} batched outputs differ from single images'.format(nms_mode)
+    assert results['per_class'] == results['offset'], 'NMS modes disagree'
+    assert batch_results['per_class'] == batch_results['offset'], 'NMS modes disagree on batches'
+    print('per_class and offset outputs match on {} inputs and a batch of {}'.format(
+        len(results['offset']), len(batch_shapes)))
+
+
+if __name__ == '__main__':
+    main()
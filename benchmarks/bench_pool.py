@@ -0,0 +1,33 @@
+"""Scaling benchmark for `YOLOPool`: throughput with 1..N worker processes"""
+import argparse
+import os
+from timeit import default_timer as timer
+
+import numpy as np
+
+from models.keras_yolov3.src.pool import YOLOPool
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() // 4 or 1)
+    parser.add_argument('--images', '-n', type=int, default=64, help='Images per measurement')
+    parser.add_argument('--pin-cpus', action='store_true', help='Pin every worker to its own cores')
+    args = parser.parse_args()
+    rng = np.random.RandomState(0)
+    images = [rng.randint(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    baseline = None
+    print('{:>7} {:>8} {:>10} {:>8}'.format('workers', 'threads', 'images/s', 'speedup'))
+    for num_workers in range(1, args.max_workers + 1):
+        with YOLOPool(num_workers=num_workers, pin_cpus=args.pin_cpus) as pool:
+            pool.detect_batch(images[:num_workers])  # warm up every worker
+            start = timer()
+            pool.detect_batch([images[i % len(images)] for i in range(args.images)])
+            throughput = args.images / (timer() - start)
+            baseline = baseline or throughput
+            print('{:>7} {:>8} {:>10.2f} {:>7.2f}x'.format(
+                num_workers, pool.threads_per_worker, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
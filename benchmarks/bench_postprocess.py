@@ -0,0 +1,55 @@
+"""Benchmark in-graph `yolo_eval` against host-side `yolo_eval_numpy` on raw head outputs"""
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+from keras import backend as K
+
+from models.keras_yolov3.src.yolo3.model import yolo_eval
+from models.keras_yolov3.src.yolo3.postprocess import yolo_eval_numpy
+from .synthetic import ANCHORS, random_head_outputs
+from .bench_nms import as_set
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', '-n', type=int, default=50, help='Runs to time per backend')
+    parser.add_argument('--size', type=int, default=416, help='Model input size (default=416)')
+    parser.add_argument('--num-classes', type=int, default=80)
+    parser.add_argument('--score', type=float, default=0.3)
+    args = parser.parse_args()
+    rng = np.random.RandomState(0)
+    image_shape = [480, 640]
+    feeds = [[output[0] for output in random_head_outputs(args.size, args.num_classes, rng)] for _ in range(4)]
+
+    inputs = [K.placeholder(shape=(None, None, None, 3 * (args.num_classes + 5))) for _ in range(3)]
+    shape_input = K.placeholder(shape=(2,))
+    fetches = yolo_eval(inputs, ANCHORS, args.num_classes, shape_input,
+                        score_threshold=args.score, iou_threshold=0.45)
+    sess = K.get_session()
+
+    def run_graph(feed):
+        feed_dict = dict(zip(inputs, [output[None] for output in feed]))
+        feed_dict[shape_input] = image_shape
+        return sess.run(fetches, feed_dict=feed_dict)
+
+    def run_numpy(feed):
+        return yolo_eval_numpy(feed, ANCHORS, args.num_classes, image_shape,
+                               score_threshold=args.score, iou_threshold=0.45)
+
+    for name, fn in (('graph', run_graph), ('numpy', run_numpy)):
+        fn(feeds[0])
+        start = timer()
+        for i in range(args.iterations):
+            fn(feeds[i % len(feeds)])
+        print('{:<6} {:7.2f} ms/image'.format(name, (timer() - start) / args.iterations * 1e3))
+
+    for feed in feeds:
+        graph_set, numpy_set = as_set(*run_graph(feed)), as_set(*run_numpy(feed))
+        assert len(graph_set) == len(numpy_set), 'backends disagree on box count'
+        np.testing.assert_allclose(np.array(graph_set), np.array(numpy_set), rtol=1e-3, atol=1e-2)
+    print('graph and numpy outputs match on {} inputs'.format(len(feeds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+float16 against float32 inference: weight and peak memory, latency and box agreement
+
+    python -m benchmarks.bench_precision --images 'samples/*.jpg'
+
+Every precision runs in its own process so that peak resident memory is not
+shared. Without --images a fixed set of random images is used, which measures
+memory and latency but makes the agreement figure meaningless. float16
+convolutions are only fast on CPUs with native half precision arithmetic
+(AVX-512 FP16, or AMX); elsewhere TensorFlow converts and float16 is slower.
+"""
+import argparse
+import glob
+import json
+import resource
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+from models.keras_yolov3.src.detection import DetectionBatch
+from .bench_tracking import agreement
+
+
+def load_images(pattern, num_images):
+    if pattern:
+        return [np.asarray(Image.open(path).convert('RGB')) for path in sorted(glob.glob(pattern))[:num_images]]
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(num_images)]
+
+
+def run_precision(args):
+    from models.keras_yolov3.src.yolo import YOLO
+    images = load_images(args.images, args.num_images)
+    import tensorflow as tf
+    yolo = YOLO(precision=args.precision, fold_batchnorm=args.fold_batchnorm)
+    with yolo.sess.graph.as_default():
+        # Every variable in the session, not only those of the model that runs.
+        weight_bytes = sum(v.shape.num_elements() * v.dtype.base_dtype.size for v in tf.global_variables())
+    yolo.detect_columnar(images[0])  # warm up
+    start = timer()
+    batches = [yolo.detect_columnar(image) for image in images]
+    latency = (timer() - start) / len(images)
+    print(json.dumps({
+        'precision': args.precision,
+        'weights_mb': weight_bytes / 2. ** 20,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+        'ms_per_image': latency * 1e3,
+        'detections': [[b.boxes.tolist(), b.scores.tolist(), b.class_ids.tolist()] for b in batches],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', help='Glob of the fixed image set (default: random images)')
+    parser.add_argument('--num-images', type=int, default=20)
+    parser.add_argument('--fold-batchnorm', action='store_true', help='Fold BatchNormalization in both runs')
+    parser.add_argument('--iou', type=float, default=.5, help='IoU for a box to agree (default=.5)')
+    parser.add_argument('--precision', choices=['float32', 'float16'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.precision:
+        run_precision(args)
+        return
+
+    results = {}
+    for precision in ('float32', 'float16'):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_precision',
+                                          '--precision', precision] + sys.argv[1:])
+        results[precision] = json.loads(output.decode().strip().splitlines()[-1])
+
+    def batches(result):
+        return [DetectionBatch(*d, class_names=None) for d in result['detections']]
+    reference = batches(results['float32'])
+    print('{:<8} {:>11} {:>13} {:>10} {:>9}'.format('model', 'weights MB', 'peak RSS MB', 'ms/image', 'agreement'))
+    for precision, result in results.items():
+        score = np.mean([agreement(ref, b, args.iou) for ref, b in zip(reference, batches(result))])
+        print('{:<8} {:>11.1f} {:>13.1f} {:>10.1f} {:>9.3f}'.format(
+            precision, result['weights_mb'], result['peak_rss_mb'], result['ms_per_image'], score))
+
+
+if __name__ == '__main__':
+    main()
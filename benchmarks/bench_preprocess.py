@@ -0,0 +1,50 @@
+"""Microbenchmark: per-frame letterbox preprocessing cost, PIL path vs. cv2/NumPy buffer path"""
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+from models.keras_yolov3.src.yolo3.utils import letterbox_image, letterbox_array
+
+
+def preprocess_pil(frame, size):
+    """Preprocessing as done by `YOLO.detect` before the NumPy path"""
+    boxed_image = letterbox_image(Image.fromarray(frame), size)
+    image_data = np.array(boxed_image, dtype='float32')
+    image_data /= 255.
+    return image_data
+
+
+def time_per_frame(fn, frames, iterations):
+    fn(frames[0])  # warm up caches and lazy cv2 initialisation
+    start = timer()
+    for i in range(iterations):
+        fn(frames[i % len(frames)])
+    return (timer() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', '-n', type=int, default=200, help='Frames to time per case')
+    parser.add_argument('--size', type=int, default=416, help='Model input size (default=416)')
+    args = parser.parse_args()
+    size = (args.size, args.size)
+    buffer = np.empty((args.size, args.size, 3), dtype='float32')
+    rng = np.random.RandomState(0)
+    for width, height in [(640, 480), (1280, 960), (1920, 1080)]:
+        frames = [rng.randint(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        cases = [
+            ('pil bicubic', lambda f: preprocess_pil(f, size)),
+            ('cv2 cubic', lambda f: letterbox_array(f, size, out=buffer)),
+            ('cv2 cubic bgr', lambda f: letterbox_array(f, size, out=buffer, swap_rb=True)),
+            ('cv2 linear', lambda f: letterbox_array(f, size, out=buffer, interpolation='linear')),
+            ('cv2 area', lambda f: letterbox_array(f, size, out=buffer, interpolation='area')),
+        ]
+        for name, fn in cases:
+            seconds = time_per_frame(fn, frames, args.iterations)
+            print('{}x{} {:<14} {:8.3f} ms/frame'.format(width, height, name, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
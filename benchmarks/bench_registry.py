@@ -0,0 +1,47 @@
+"""Benchmark detectors sharing one model through a `ModelRegistry` against one model each
+
+Every run builds --detectors detectors with different score/IoU thresholds in a fresh
+interpreter and reports construction time, peak resident memory and detection latency.
+"""
+import argparse
+import subprocess
+import sys
+
+SNIPPET = '''
+import resource
+from timeit import default_timer as timer
+import numpy as np
+from models.keras_yolov3.src.yolo import YOLO
+from models.keras_yolov3.src.registry import ModelRegistry
+registry = ModelRegistry() if {shared} else None
+start = timer()
+detectors = [YOLO(registry=registry, score=.1 + .1 * i, iou=.3 + .05 * i) for i in range({detectors})]
+constructed = timer()
+image = np.zeros((480, 640, 3), dtype=np.uint8)
+for yolo in detectors:
+    yolo.detect(image)  # warm up
+detect_start = timer()
+for yolo in detectors:
+    yolo.detect(image)
+print(constructed - start, (timer() - detect_start) / len(detectors),
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.)
+'''
+
+
+def run(shared, detectors):
+    output = subprocess.check_output([sys.executable, '-c', SNIPPET.format(shared=shared, detectors=detectors)])
+    return [float(t) for t in output.decode().strip().splitlines()[-1].split()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--detectors', '-d', type=int, default=3, help='Detector configurations (default=3)')
+    args = parser.parse_args()
+    for name, shared in (('separate', False), ('registry', True)):
+        constructed, latency, peak_rss = run(shared, args.detectors)
+        print('{:<9} construct {:7.0f} ms  detect {:6.1f} ms  peak RSS {:7.1f} MB'.format(
+            name, constructed * 1e3, latency * 1e3, peak_rss))
+
+
+if __name__ == '__main__':
+    main()
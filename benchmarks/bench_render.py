@@ -0,0 +1,73 @@
+"""Benchmark annotated rendering: the former per-frame PIL path against the cached cv2 `Renderer`"""
+import argparse
+import os
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image, ImageFont, ImageDraw
+
+from models.keras_yolov3.src.detection import DetectionBatch
+from models.keras_yolov3.src.render import Renderer
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'keras_yolov3', 'src', 'font',
+                         'FiraMono-Medium.otf')
+
+
+def render_pil(image, detections):
+    """Drawing as `YOLO.detect_image` did it: font loaded per frame, one rectangle per pixel of thickness"""
+    font = ImageFont.truetype(font=FONT_PATH, size=np.floor(3e-2 * image.size[1] + 0.5).astype('int32'))
+    thickness = (image.size[0] + image.size[1]) // 300
+    for det in detections:
+        label = '{} {:.2f}'.format(det.label, det.score)
+        draw = ImageDraw.Draw(image)
+        label_size = draw.textsize(label, font)
+        left, top, right, bottom = det.bbox
+        if top - label_size[1] >= 0:
+            text_origin = np.array([left, top - label_size[1]])
+        else:
+            text_origin = np.array([left, top + 1])
+        for i in range(thickness):
+            draw.rectangle([left + i, top + i, right - i, bottom - i], outline=det.color)
+        draw.rectangle([tuple(text_origin), tuple(text_origin + label_size)], fill=det.color)
+        draw.text(text_origin, label, fill=(0, 0, 0), font=font)
+        del draw
+    return image
+
+
+def random_detections(rng, num_boxes, width, height, class_names, colors):
+    x1 = rng.randint(0, width - 100, num_boxes)
+    y1 = rng.randint(0, height - 100, num_boxes)
+    boxes = np.stack([x1, y1, x1 + rng.randint(20, 100, num_boxes), y1 + rng.randint(20, 100, num_boxes)], axis=-1)
+    scores = np.round(rng.uniform(0.3, 1., num_boxes), 2)
+    return DetectionBatch(boxes, scores, rng.randint(0, len(class_names), num_boxes), class_names, colors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', '-n', type=int, default=100)
+    parser.add_argument('--boxes', type=int, default=20, help='Detections per frame')
+    args = parser.parse_args()
+    rng = np.random.RandomState(0)
+    class_names = ['class_{}'.format(i) for i in range(80)]
+    colors = [tuple(int(c) for c in rng.randint(0, 256, 3)) for _ in class_names]
+    width, height = 1280, 720
+    frame = rng.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    detections = [list(random_detections(rng, args.boxes, width, height, class_names, colors)) for _ in range(8)]
+    out = np.empty_like(frame)
+    renderer = Renderer()
+    cases = [
+        ('pil per-frame font', lambda d: render_pil(Image.fromarray(frame), d)),
+        ('cv2 renderer copy', lambda d: renderer.draw(frame, d)),
+        ('cv2 renderer buffer', lambda d: renderer.draw(frame, d, out=out)),
+        ('disabled', lambda d: Renderer(enabled=False).draw(frame, d, out=out)),
+    ]
+    for name, fn in cases:
+        fn(detections[0])
+        start = timer()
+        for i in range(args.iterations):
+            fn(detections[i % len(detections)])
+        print('{:<20} {:7.3f} ms/frame'.format(name, (timer() - start) / args.iterations * 1e3))
+
+
+if __name__ == '__main__':
+    main()
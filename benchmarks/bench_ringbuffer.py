@@ -0,0 +1,104 @@
+"""Benchmark allocation churn and RSS of the capture -> resize -> draw loop, with and without `FrameRing`
+
+Without --video, capture is simulated by copying a synthetic frame, as a
+decoder would; with --video, frames are decoded from the given file.
+"""
+import argparse
+import resource
+import tracemalloc
+from timeit import default_timer as timer
+
+import numpy as np
+import cv2
+
+from models.keras_yolov3.src.ringbuffer import FrameRing
+
+DISPLAY_SIZE = (1280, 960)
+
+
+class SyntheticCapture(object):
+    """Stands in for cv2.VideoCapture: `read` returns a copy of a fixed frame, or writes into `image`"""
+
+    def __init__(self, shape, num_frames):
+        self.frame = np.random.RandomState(0).randint(0, 256, shape, dtype=np.uint8)
+        self.remaining = num_frames
+
+    def read(self, image=None):
+        if self.remaining <= 0:
+            return False, None
+        self.remaining -= 1
+        if image is None:
+            return True, self.frame.copy()
+        image[...] = self.frame
+        return True, image
+
+
+def open_capture(args):
+    if args.video:
+        return cv2.VideoCapture(args.video)
+    return SyntheticCapture((1080, 1920, 3), args.frames)
+
+
+def draw(img):
+    cv2.rectangle(img, (100, 100), (400, 300), (0, 255, 0), 3)
+    cv2.putText(img, 'person 99.00%', (100, 87), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+
+def allocating_loop(capture, frames):
+    """The per-frame allocations of yolo_demo.py before the ring buffer"""
+    for _ in range(frames):
+        ok, frame = capture.read()
+        if not ok:
+            break
+        img = cv2.resize(frame, DISPLAY_SIZE)
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img_draw = img.copy()
+        draw(img_draw)
+        del rgb
+
+
+def ring_loop(capture, frames, shape):
+    ring = FrameRing(2, shape)
+    img = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+    for _ in range(frames):
+        slot = ring.read(capture)
+        if slot is None:
+            break
+        cv2.resize(ring.frames[slot], DISPLAY_SIZE, dst=img)
+        ring.release(slot)
+        draw(img)
+    ring.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', help='Video file to decode (default: synthetic 1080p frames)')
+    parser.add_argument('--frames', '-n', type=int, default=300)
+    parser.add_argument('mode', choices=['allocating', 'ring'],
+                        help='Run one mode per process so that RSS numbers are not mixed')
+    args = parser.parse_args()
+    capture = open_capture(args)
+    if args.video:
+        shape = (int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+    else:
+        shape = capture.frame.shape
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = timer()
+    if args.mode == 'allocating':
+        allocating_loop(capture, args.frames)
+    else:
+        ring_loop(capture, args.frames, shape)
+    elapsed = timer() - start
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size for stat in snapshot.statistics('filename'))
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('{:<10} {:7.2f} ms/frame  traced peak {:7.1f} MB  retained {:6.1f} MB  max RSS growth {:7.1f} MB'.format(
+        args.mode, elapsed / args.frames * 1e3, peak / 2 ** 20, allocated / 2 ** 20,
+        (rss_after - rss_before) / 1024.))
+
+
+if __name__ == '__main__':
+    main()
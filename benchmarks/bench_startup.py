@@ -0,0 +1,45 @@
+"""Benchmark cold start: `YOLO()` from the .h5 against `YOLO.from_frozen` on an exported graph
+
+Every measurement runs in a fresh interpreter, timing construction plus the first detection,
+with and without `warmup_on_init` (which moves first-run cost from the first detection into construction).
+"""
+import argparse
+import subprocess
+import sys
+
+SNIPPET = '''
+from timeit import default_timer as timer
+start = timer()
+import numpy as np
+from models.keras_yolov3.src.yolo import YOLO
+imported = timer()
+yolo = {constructor}
+constructed = timer()
+yolo.detect(np.zeros((480, 640, 3), dtype=np.uint8))
+print(imported - start, constructed - imported, timer() - constructed)
+'''
+
+
+def cold_start(constructor):
+    output = subprocess.check_output([sys.executable, '-c', SNIPPET.format(constructor=constructor)])
+    return [float(t) for t in output.decode().strip().splitlines()[-1].split()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('frozen_path', help='Graph written by models.keras_yolov3.src.export')
+    parser.add_argument('--repeats', '-n', type=int, default=3)
+    args = parser.parse_args()
+    for name, constructor in (('keras .h5', 'YOLO()'),
+                              ('keras+wu', 'YOLO(warmup_on_init=True)'),
+                              ('frozen', 'YOLO.from_frozen({!r})'.format(args.frozen_path)),
+                              ('frozen+wu', 'YOLO.from_frozen({!r}, warmup_on_init=True)'.format(args.frozen_path))):
+        for _ in range(args.repeats):
+            imported, constructed, first_detect = cold_start(constructor)
+            print('{:<10} import {:6.0f} ms  construct {:6.0f} ms  first detect {:6.0f} ms  total {:6.0f} ms'.format(
+                name, imported * 1e3, constructed * 1e3, first_detect * 1e3,
+                (imported + constructed + first_detect) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
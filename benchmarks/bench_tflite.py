@@ -0,0 +1,65 @@
+"""
+TFLite backends against the float32 Keras model: CPU latency, model size and box agreement
+
+    python -m benchmarks.bench_tflite --annotations train.txt --num-images 50
+
+Every quantization mode is exported to a temporary directory (int8 is calibrated
+on the first --num-calibration images of the annotation file, agreement is
+measured on the last --num-images ones) and run with `YOLO.from_tflite`.
+"""
+import argparse
+import os
+import tempfile
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+from models.keras_yolov3.src.yolo import YOLO
+from models.keras_yolov3.src.tflite import QUANTIZATIONS, export_tflite
+from .bench_tracking import agreement
+
+
+def run(yolo, images):
+    yolo.detect_columnar(images[0])  # warm up
+    start = timer()
+    batches = [yolo.detect_columnar(image) for image in images]
+    return batches, (timer() - start) / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--annotations', required=True, help='Annotation file, as used by train.py')
+    parser.add_argument('--num-images', type=int, default=50, help='Images agreement is measured on')
+    parser.add_argument('--num-calibration', type=int, default=100)
+    parser.add_argument('--modes', nargs='+', choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads')
+    parser.add_argument('--iou', type=float, default=.5, help='IoU for a box to agree (default=.5)')
+    args = parser.parse_args()
+
+    with open(args.annotations) as f:
+        paths = [line.split()[0] for line in f if line.strip()]
+    images = [np.asarray(Image.open(path).convert('RGB')) for path in paths[-args.num_images:]]
+    calibration_path = os.path.join(tempfile.mkdtemp(), 'calibration.txt')
+    with open(calibration_path, 'w') as f:
+        f.write('\n'.join(paths[:args.num_calibration]))
+
+    yolo = YOLO(postprocess='numpy')
+    reference, reference_latency = run(yolo, images)
+    print('{:<8} {:>9} {:>10} {:>9}'.format('model', 'size MB', 'ms/image', 'agreement'))
+    print('{:<8} {:>9.1f} {:>10.1f} {:>9.3f}'.format(
+        'keras', os.path.getsize(yolo.model_path) / 2. ** 20, reference_latency * 1e3, 1.))
+    output_dir = tempfile.mkdtemp()
+    for mode in args.modes:
+        path = os.path.join(output_dir, 'yolo_{}.tflite'.format(mode))
+        export_tflite(yolo, path, mode, calibration_path, args.num_calibration)
+        lite = YOLO.from_tflite(path, num_threads=args.threads)
+        batches, latency = run(lite, images)
+        score = np.mean([agreement(ref, batch, args.iou) for ref, batch in zip(reference, batches)])
+        print('{:<8} {:>9.1f} {:>10.1f} {:>9.3f}'.format(mode, os.path.getsize(path) / 2. ** 20, latency * 1e3, score))
+        lite.close_session()
+    yolo.close_session()
+
+
+if __name__ == '__main__':
+    main()
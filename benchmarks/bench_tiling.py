@@ -0,0 +1,75 @@
+"""
+Tiled against full-resolution detection on a large image: latency, peak memory and box count
+
+    python -m benchmarks.bench_tiling --image inspection.jpg --tile-size 416 --overlap 64
+
+Every mode runs in its own process, so the peak resident memory of one does not
+hide the other's.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+def load_image(path, width, height):
+    if path:
+        import cv2
+        return cv2.imread(path)
+    return np.random.RandomState(0).randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def run_mode(args):
+    from models.keras_yolov3.src.yolo import YOLO
+    image = load_image(args.image, args.width, args.height)
+    if args.mode == 'full':
+        yolo = YOLO(model_image_size=(None, None), channel_order='bgr')
+        detect = yolo.detect_columnar
+    else:
+        yolo = YOLO(model_image_size=(args.tile_size, args.tile_size), channel_order='bgr')
+
+        def detect(img):
+            return yolo.detect_tiled_columnar(img, overlap=args.overlap, batch_size=args.batch_size)
+    batch = detect(image)  # warm up
+    latencies = []
+    for _ in range(args.iterations):
+        start = timer()
+        batch = detect(image)
+        latencies.append(timer() - start)
+    print(json.dumps({
+        'mode': args.mode,
+        'median_ms': float(np.median(latencies) * 1e3),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+        'boxes': len(batch),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', help='Image to detect on (default: random 3840x2160 pixels)')
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--tile-size', type=int, default=416)
+    parser.add_argument('--overlap', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=None, help='Tiles per session run (default: all)')
+    parser.add_argument('--iterations', '-n', type=int, default=5)
+    parser.add_argument('--mode', choices=['full', 'tiled'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args)
+        return
+
+    print('{:<6} {:>10} {:>13} {:>6}'.format('mode', 'median ms', 'peak RSS MB', 'boxes'))
+    for mode in ('full', 'tiled'):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_tiling', '--mode', mode] +
+                                         sys.argv[1:])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print('{mode:<6} {median_ms:>10.1f} {peak_rss_mb:>13.1f} {boxes:>6}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Keyframe detection with tracking against per-frame detection on a recorded clip
+
+    python -m benchmarks.bench_tracking clip.mp4 --intervals 2 5 10
+
+Reports the speedup over running `YOLO.detect` on every frame, and the box
+agreement with it: the F1 score of tracked boxes matched to per-frame
+detections of the same class at IoU >= --iou, averaged over frames.
+"""
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import cv2
+
+from models.keras_yolov3.src.yolo import YOLO
+from models.keras_yolov3.src.tracker import KeyframeDetector, iou_matrix, greedy_match
+
+
+def read_frames(path, max_frames):
+    vid = cv2.VideoCapture(path)
+    if not vid.isOpened():
+        raise IOError("Couldn't open video {}".format(path))
+    frames = []
+    while len(frames) < max_frames:
+        return_value, frame = vid.read()
+        if not return_value:
+            break
+        frames.append(frame)
+    vid.release()
+    return frames
+
+
+def agreement(reference, batch, iou_threshold):
+    """F1 score of `batch` against `reference` detections"""
+    if not len(reference) and not len(batch):
+        return 1.
+    iou = iou_matrix(reference.boxes, batch.boxes)
+    iou[reference.class_ids[:, None] != batch.class_ids[None, :]] = 0
+    matched, _ = greedy_match(iou, iou_threshold)
+    return 2. * len(matched) / (len(reference) + len(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video', help='Recorded clip')
+    parser.add_argument('--intervals', nargs='+', type=int, default=[2, 5, 10])
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--iou', type=float, default=.5, help='IoU for a tracked box to agree (default=.5)')
+    args = parser.parse_args()
+
+    frames = read_frames(args.video, args.max_frames)
+    yolo = YOLO(channel_order='bgr')
+    yolo.detect_columnar(frames[0])  # warm up
+
+    start = timer()
+    reference = [yolo.detect_columnar(frame) for frame in frames]
+    full_time = timer() - start
+    print('{} frames, per-frame detection {:.1f} ms/frame'.format(len(frames), full_time / len(frames) * 1e3))
+    print('{:>8} {:>9} {:>10} {:>8} {:>9}'.format('interval', 'keyframes', 'ms/frame', 'speedup', 'agreement'))
+    for interval in args.intervals:
+        keyframes = KeyframeDetector(yolo, interval=interval)
+        start = timer()
+        batches = [keyframes.detect_columnar(frame) for frame in frames]
+        elapsed = timer() - start
+        score = np.mean([agreement(ref, batch, args.iou) for ref, batch in zip(reference, batches)])
+        print('{:>8} {:>9} {:>10.1f} {:>7.2f}x {:>9.3f}'.format(
+            interval, keyframes.keyframes, elapsed / len(frames) * 1e3, full_time / elapsed, score))
+    yolo.close_session()
+
+
+if __name__ == '__main__':
+    main()
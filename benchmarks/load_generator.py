@@ -0,0 +1,73 @@
+"""Load generator for the local detection service (models.keras_yolov3.src.serve)
+
+Sends JPEG-encoded synthetic frames from a number of concurrent clients over
+keep-alive connections and reports p50/p99 latency and throughput per
+concurrency level. Only targets localhost.
+"""
+import argparse
+import asyncio
+from timeit import default_timer as timer
+
+import numpy as np
+import cv2
+
+LOCALHOST = ('127.0.0.1', 'localhost', '::1')
+
+
+async def client(host, port, body, deadline, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = ('POST /detect HTTP/1.1\r\nHost: {}\r\nContent-Type: image/jpeg\r\n'
+               'Content-Length: {}\r\n\r\n').format(host, len(body)).encode('latin-1') + body
+    try:
+        while timer() < deadline:
+            start = timer()
+            writer.write(request)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            if b' 200 ' not in status:
+                raise IOError('request failed: {}'.format(status.decode().strip()))
+            latencies.append(timer() - start)
+    finally:
+        writer.close()
+
+
+async def run_level(host, port, body, concurrency, duration):
+    latencies = []
+    start = timer()
+    await asyncio.gather(*[client(host, port, body, start + duration, latencies) for _ in range(concurrency)])
+    return latencies, timer() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=10., help='Seconds per concurrency level')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args()
+    assert args.host in LOCALHOST, 'The load generator only targets localhost'
+
+    frame = np.random.RandomState(0).randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    body = cv2.imencode('.jpg', frame)[1].tobytes()
+    loop = asyncio.get_event_loop()
+    print('{:>11} {:>9} {:>9} {:>9} {:>12}'.format('concurrency', 'requests', 'p50 ms', 'p99 ms', 'images/s'))
+    for concurrency in args.concurrency:
+        latencies, elapsed = loop.run_until_complete(
+            run_level(args.host, args.port, body, concurrency, args.duration))
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        print('{:>11} {:>9} {:>9.1f} {:>9.1f} {:>12.1f}'.format(
+            concurrency, len(latencies), p50, p99, len(latencies) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
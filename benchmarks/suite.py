@@ -0,0 +1,192 @@
+"""Offline benchmark suite for yolo_body / tiny_yolo_body
+
+Models are built with randomly initialised weights and fed synthetic images, so
+nothing is downloaded. For every model, input size and batch size it measures:
+
+    preprocess  letterbox_array of the batch into the input buffer
+    forward     the model body alone
+    eval        yolo_eval post-processing, fed precomputed head outputs
+    train       one yolo_loss optimisation step
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json --tolerance 0.15  # exits 1 on regression
+"""
+import argparse
+import json
+import platform
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+from .synthetic import ANCHORS, TINY_ANCHORS, random_images, random_true_boxes
+
+STAGES = ('preprocess', 'forward', 'eval', 'train')
+
+
+def measure(fn, warmup, iterations):
+    """Latencies in seconds of `iterations` calls, after `warmup` untimed ones"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = timer()
+        fn()
+        latencies.append(timer() - start)
+    return np.array(latencies)
+
+
+class ModelBench(object):
+    """
+    Graph and session for one model variant, with randomly initialised weights
+    Args:
+        model (str): 'yolo' or 'tiny'
+        num_classes (int): classes of the detection head
+        stages (tuple): stages that will be measured; the training graph is only built when needed
+    """
+
+    def __init__(self, model, num_classes, stages):
+        import tensorflow as tf
+        from keras import backend as K
+        from keras.layers import Input
+        from models.keras_yolov3.src.yolo3.model import yolo_body, tiny_yolo_body, yolo_eval, yolo_loss
+
+        K.clear_session()
+        self.K = K
+        self.num_classes = num_classes
+        self.anchors = TINY_ANCHORS if model == 'tiny' else ANCHORS
+        num_layers = len(self.anchors) // 3
+        body = tiny_yolo_body if model == 'tiny' else yolo_body
+        self.body = body(Input(shape=(None, None, 3)), len(self.anchors) // num_layers, num_classes)
+        self.image_shape = K.placeholder(shape=(None, 2))
+        self.eval_outputs = yolo_eval(self.body.output, self.anchors, num_classes, self.image_shape,
+                                      score_threshold=.3, iou_threshold=.45)
+        self.y_true = None
+        if 'train' in stages:
+            self.y_true = [K.placeholder(shape=(None, None, None, 3, num_classes + 5)) for _ in range(num_layers)]
+            self.loss = yolo_loss(self.body.output + self.y_true, self.anchors, num_classes)
+            self.train_op = tf.train.AdamOptimizer(1e-3).minimize(self.loss)
+        self.sess = K.get_session()
+        self.sess.run(tf.global_variables_initializer())
+
+    def run_stage(self, stage, size, batch_size, rng, warmup, iterations):
+        from models.keras_yolov3.src.yolo3.utils import letterbox_array
+        from models.keras_yolov3.src.yolo3.model import preprocess_true_boxes
+
+        K = self.K
+        images = random_images(batch_size, rng)
+        image_data = np.empty((batch_size, size, size, 3), dtype='float32')
+        for i, image in enumerate(images):
+            letterbox_array(image, (size, size), out=image_data[i])
+        image_shapes = [list(image.shape[:2]) for image in images]
+
+        if stage == 'preprocess':
+            def fn():
+                for i, image in enumerate(images):
+                    letterbox_array(image, (size, size), out=image_data[i])
+        elif stage == 'forward':
+            feed = {self.body.input: image_data, K.learning_phase(): 0}
+
+            def fn():
+                self.sess.run(self.body.output, feed_dict=feed)
+        elif stage == 'eval':
+            head_outputs = self.sess.run(self.body.output, feed_dict={self.body.input: image_data,
+                                                                      K.learning_phase(): 0})
+            # Feeding the head outputs leaves only the yolo_eval subgraph to run.
+            feed = dict(zip(self.body.output, head_outputs))
+            feed[self.image_shape] = image_shapes
+
+            def fn():
+                self.sess.run(self.eval_outputs, feed_dict=feed)
+        elif stage == 'train':
+            true_boxes = random_true_boxes(batch_size, size, self.num_classes, rng)
+            y_true = preprocess_true_boxes(true_boxes, (size, size), self.anchors, self.num_classes)
+            feed = dict(zip(self.y_true, y_true))
+            feed[self.body.input] = image_data
+            feed[K.learning_phase()] = 1
+
+            def fn():
+                self.sess.run(self.train_op, feed_dict=feed)
+        else:
+            raise ValueError('Unknown stage {}'.format(stage))
+        return measure(fn, warmup, iterations)
+
+
+def result_key(result):
+    return result['model'], result['size'], result['batch'], result['stage']
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare median latencies against a baseline run
+    Returns:
+        list: (key, baseline ms, current ms) of every regression beyond `tolerance`
+    """
+    baseline = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        reference = baseline.get(result_key(result))
+        if reference is None:
+            continue
+        ratio = result['median_ms'] / reference['median_ms']
+        print('{:<5} {:>4} b{:<3} {:<10} {:9.2f} ms vs {:9.2f} ms  {:+6.1f}%'.format(
+            *result_key(result), result['median_ms'], reference['median_ms'], (ratio - 1) * 100))
+        if ratio > 1 + tolerance:
+            regressions.append((result_key(result), reference['median_ms'], result['median_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', choices=['yolo', 'tiny'], default=['yolo', 'tiny'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[320, 416, 608])
+    parser.add_argument('--batches', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--num-classes', type=int, default=80)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--iterations', '-n', type=int, default=10)
+    parser.add_argument('--output', '-o', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed relative slowdown of the median before failing (default=0.15)')
+    args = parser.parse_args()
+    for size in args.sizes:
+        assert size % 32 == 0, 'Multiples of 32 required'
+
+    results = []
+    rng = np.random.RandomState(0)
+    for model in args.models:
+        bench = ModelBench(model, args.num_classes, args.stages)
+        for size in args.sizes:
+            for batch_size in args.batches:
+                for stage in args.stages:
+                    latencies = bench.run_stage(stage, size, batch_size, rng, args.warmup, args.iterations)
+                    result = {
+                        'model': model, 'size': size, 'batch': batch_size, 'stage': stage,
+                        'median_ms': float(np.median(latencies) * 1e3),
+                        'p90_ms': float(np.percentile(latencies, 90) * 1e3),
+                        'images_per_s': float(batch_size / np.median(latencies)),
+                    }
+                    results.append(result)
+                    print('{model:<5} {size:>4} b{batch:<3} {stage:<10} median {median_ms:9.2f} ms  '
+                          'p90 {p90_ms:9.2f} ms  {images_per_s:8.1f} images/s'.format(**result))
+
+    report = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'processor': platform.processor(), 'iterations': args.iterations},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            for key, reference, current in regressions:
+                print('REGRESSION {} {} {} {}: {:.2f} ms -> {:.2f} ms'.format(*key + (reference, current)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
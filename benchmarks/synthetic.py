@@ -0,0 +1,35 @@
+"""Synthetic inputs shared by the benchmarks"""
+import numpy as np
+
+ANCHORS = np.array([10, 13, 16, 30, 33, 23, 30, 61, 62, 45, 59, 119, 116, 90, 156, 198, 373, 326],
+                   dtype='float32').reshape(-1, 2)
+TINY_ANCHORS = np.array([10, 14, 23, 27, 37, 58, 81, 82, 135, 169, 344, 319], dtype='float32').reshape(-1, 2)
+
+
+def random_head_outputs(size, num_classes, rng, batch_size=1):
+    """Raw head outputs with a realistic, mostly negative objectness/class logit distribution"""
+    outputs = []
+    for stride in (32, 16, 8):
+        grid = size // stride
+        feats = rng.normal(0, 1, (batch_size, grid, grid, 3, num_classes + 5)).astype('float32')
+        feats[..., 4:] -= 4.
+        outputs.append(feats.reshape(batch_size, grid, grid, 3 * (num_classes + 5)))
+    return outputs
+
+
+def random_images(num_images, rng, width=640, height=480):
+    """uint8 RGB frames"""
+    return [rng.randint(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(num_images)]
+
+
+def random_true_boxes(batch_size, size, num_classes, rng, max_boxes=20):
+    """(batch, max_boxes, 5) ground truth in input pixels: x_min, y_min, x_max, y_max, class"""
+    true_boxes = np.zeros((batch_size, max_boxes, 5), dtype='float32')
+    for b in range(batch_size):
+        n = rng.randint(1, max_boxes + 1)
+        mins = rng.uniform(0, size * .8, (n, 2))
+        maxes = np.minimum(mins + rng.uniform(8, size * .5, (n, 2)), size - 1)
+        true_boxes[b, :n, 0:2] = mins
+        true_boxes[b, :n, 2:4] = maxes
+        true_boxes[b, :n, 4] = rng.randint(0, num_classes, n)
+    return true_boxes
@@ -1 +1,12 @@
-from .yolov3 import YOLOV3
+"""YOLOv3 detector package
+
+`YOLOV3` is imported on first access, so that importing this package (or the
+lightweight helpers below it) does not pull in Keras and TensorFlow.
+"""
+
+
+def __getattr__(name):
+    if name == 'YOLOV3':
+        from .yolov3 import YOLOV3
+        return YOLOV3
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,95 @@
+"""
+Latency-budget-driven choice of the model input resolution
+
+The YOLO body is fully convolutional, so the same weights can run at any
+multiple of 32. `ResolutionController` keeps a moving average of the per-image
+latency and walks a ladder of square input sizes: down as soon as the average
+stays over budget for `patience` images, up only when the latency predicted for
+the next rung is comfortably under budget. The two thresholds keep it from
+oscillating between neighbouring rungs.
+"""
+
+DEFAULT_LADDER = (320, 416, 512, 608)
+
+
+class ResolutionController(object):
+    """
+    Picks an input size from a ladder of square, multiple-of-32 resolutions
+    Args:
+        ladder (tuple): input sizes to choose from
+        latency_budget (float): target latency per image in seconds
+        initial (int): starting size, the closest rung is used (default: the largest rung)
+        smoothing (float): weight of the newest sample in the exponential moving average
+        down_ratio (float): step down when the average exceeds latency_budget * down_ratio
+        up_ratio (float): step up when the latency predicted for the next rung is below
+            latency_budget * up_ratio
+        patience (int): consecutive samples that must agree before switching
+    """
+
+    def __init__(self, ladder=DEFAULT_LADDER, latency_budget=.1, initial=None, smoothing=.2,
+                 down_ratio=1., up_ratio=.8, patience=5):
+        assert ladder, 'Empty resolution ladder'
+        for size in ladder:
+            assert size % 32 == 0, 'Multiples of 32 required'
+        assert up_ratio < down_ratio, 'up_ratio must be below down_ratio for hysteresis'
+        self.ladder = tuple(sorted(set(ladder)))
+        self.latency_budget = latency_budget
+        self.smoothing = smoothing
+        self.down_ratio = down_ratio
+        self.up_ratio = up_ratio
+        self.patience = patience
+        if initial is None:
+            self.index = len(self.ladder) - 1
+        else:
+            self.index = min(range(len(self.ladder)), key=lambda i: abs(self.ladder[i] - initial))
+        self.average = None
+        self.switches = 0
+        self._over = 0
+        self._under = 0
+
+    @property
+    def size(self):
+        """Current (height, width), as `YOLO.model_image_size`"""
+        return self.ladder[self.index], self.ladder[self.index]
+
+    def _cost_ratio(self, index):
+        """Expected latency at rung `index` relative to the current one, from the pixel count"""
+        return (self.ladder[index] / self.ladder[self.index]) ** 2
+
+    def _switch(self, index):
+        # Rescale the average so the new rung does not start from a stale estimate.
+        self.average *= self._cost_ratio(index)
+        self.index = index
+        self.switches += 1
+        self._over = self._under = 0
+
+    def update(self, latency):
+        """
+        Record the latency of one image
+        Args:
+            latency (float): seconds spent on the image at the current size
+
+        Returns:
+            bool: True when the size changed
+        """
+        if self.average is None:
+            self.average = latency
+        else:
+            self.average += self.smoothing * (latency - self.average)
+        if self.average > self.latency_budget * self.down_ratio:
+            self._over += 1
+            self._under = 0
+        elif self.index + 1 < len(self.ladder) and \
+                self.average * self._cost_ratio(self.index + 1) < self.latency_budget * self.up_ratio:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.patience and self.index > 0:
+            self._switch(self.index - 1)
+            return True
+        if self._under >= self.patience:
+            self._switch(self.index + 1)
+            return True
+        return False
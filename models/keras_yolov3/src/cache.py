@@ -0,0 +1,143 @@
+"""
+Content-addressed cache of detection results
+
+Results are keyed by a hash of the image (decoded pixels, or the raw request
+bytes when the caller has them) combined with a hash of everything in the
+detector configuration that changes the output. The in-memory tier is a
+byte-bounded LRU; an optional directory of .npz files survives restarts and is
+shared between processes.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def image_key(image):
+    """Hash of the pixels of an np.array or PIL.Image"""
+    h = _hasher()
+    if isinstance(image, np.ndarray):
+        h.update('{}{}'.format(image.shape, image.dtype).encode())
+        h.update(memoryview(np.ascontiguousarray(image)).cast('B'))
+    else:
+        h.update('{}{}'.format(image.size, image.mode).encode())
+        h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def bytes_key(*chunks):
+    """Hash of an encoded image, and anything needed to decode it, cheaper than `image_key` when at hand"""
+    h = _hasher()
+    h.update(b'bytes')
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def config_key(*values):
+    """Hash of the configuration values the results depend on"""
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+
+def file_fingerprint(path, head_bytes=1 << 20):
+    """Cheap fingerprint of a weights file: its size, modification time and first `head_bytes` bytes"""
+    stat = os.stat(path)
+    h = _hasher()
+    h.update('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(head_bytes))
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """
+    LRU cache of (boxes, scores, class_ids) arrays
+    Args:
+        max_bytes (int): memory the cached arrays may take
+        disk_dir (str): (optional) directory of the on-disk tier, consulted on memory misses
+        metrics (Metrics): (optional) counts 'cache_hits' and 'cache_misses' in it
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, metrics=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.metrics = metrics
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir is not None and not os.path.exists(disk_dir):
+            os.makedirs(disk_dir)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + '.npz')
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.inc(name)
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: cached boxes, scores and class_ids, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            self._count('cache_hits')
+            return entry
+        if self.disk_dir is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as data:
+                entry = data['boxes'], data['scores'], data['class_ids']
+            self._put_memory(key, entry)
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+            self._count('cache_hits')
+            return entry
+        with self._lock:
+            self.misses += 1
+        self._count('cache_misses')
+        return None
+
+    def _put_memory(self, key, entry):
+        for array in entry:
+            array.setflags(write=False)  # handed out to every hit
+        size = sum(a.nbytes for a in entry) + len(key)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self._entries:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self.nbytes -= sum(a.nbytes for a in old_entry) + len(old_key)
+
+    def put(self, key, boxes, scores, class_ids):
+        entry = (np.array(boxes), np.array(scores), np.array(class_ids))
+        self._put_memory(key, entry)
+        if self.disk_dir is not None:
+            tmp_path = '{}.{}.tmp.npz'.format(self._path(key)[:-4], os.getpid())
+            np.savez(tmp_path, boxes=entry[0], scores=entry[1], class_ids=entry[2])
+            os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        """Empty the memory tier; the disk tier is left alone"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
@@ -0,0 +1,58 @@
+"""Detection result types, importable without Keras or TensorFlow"""
+
+import numpy as np
+
+
+class Detection(object):
+    __slots__ = ('bbox', 'x1', 'y1', 'x2', 'y2', 'label', 'color', 'score')
+
+    def __init__(self, bbox, label, color, score):
+        self.bbox = [int(i) for i in bbox]
+        self.x1, self.y1, self.x2, self.y2 = self.bbox
+        self.label = label
+        self.color = color
+        self.score = score
+
+
+class DetectionBatch(object):
+    """
+    Detections of one image stored as columns
+    Args:
+        boxes (np.array): int32 array of shape (n, 4), x1, y1, x2, y2
+        scores (np.array): float32 array of shape (n,)
+        class_ids (np.array): int16 array of shape (n,)
+        class_names (list): names indexed by class id, shared by all batches of a detector
+        colors (list): (optional) colors indexed by class id
+    """
+    __slots__ = ('boxes', 'scores', 'class_ids', 'class_names', 'colors')
+
+    def __init__(self, boxes, scores, class_ids, class_names, colors=None):
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.class_ids = np.asarray(class_ids, dtype=np.int16)
+        self.class_names = class_names
+        self.colors = colors
+
+    def __len__(self):
+        return len(self.scores)
+
+    @property
+    def labels(self):
+        """Class name of every box, looked up on access"""
+        return [self.class_names[c] for c in self.class_ids]
+
+    def __getitem__(self, i):
+        """`Detection` view of box i"""
+        c = self.class_ids[i]
+        return Detection(bbox=self.boxes[i],
+                         label=self.class_names[c],
+                         color=self.colors[c] if self.colors is not None else None,
+                         score=self.scores[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_detections(self):
+        """List of `Detection` objects, as returned by `YOLO.detect`"""
+        return list(self)
@@ -0,0 +1,102 @@
+"""
+Export a frozen, inference-only YOLO graph for fast-start serving with `YOLO.from_frozen`
+"""
+
+import argparse
+import json
+import os
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+from keras import backend as K
+
+DEFAULT_TRANSFORMS = [
+    'remove_nodes(op=Identity, op=CheckNumerics)',
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'strip_unused_nodes',
+    'sort_by_execution_order',
+]
+
+
+def export_frozen(yolo, output_path, transforms=DEFAULT_TRANSFORMS):
+    """
+    Freeze a detector's variables into constants and write the inference graph
+    Args:
+        yolo (YOLO): detector built with postprocess='graph' after `K.set_learning_phase(0)`,
+            so that no learning-phase switches end up in the graph
+        output_path (str): GraphDef (.pb) to write; metadata is written next to it as .json
+        transforms (list): graph transforms applied after freezing
+
+    Returns:
+        str: path of the metadata file
+    """
+    assert yolo.postprocess == 'graph', 'Export requires the in-graph post-processing'
+    graph = yolo.sess.graph
+    with graph.as_default():
+        outputs = {
+            'boxes': tf.identity(yolo.boxes, name='boxes'),
+            'scores': tf.identity(yolo.scores, name='scores'),
+            'classes': tf.identity(yolo.classes, name='classes'),
+            'batch_index': tf.identity(yolo.batch_index, name='batch_index'),
+        }
+        heads = [tf.identity(output, name='head_{}'.format(i))
+                 for i, output in enumerate(yolo.output_tensors)]
+    input_names = [yolo.input_tensor.op.name, yolo.input_image_shape.op.name,
+                   yolo.score_input.op.name, yolo.iou_input.op.name,
+                   yolo.max_boxes_input.op.name, yolo.class_mask_input.op.name]
+    output_names = [t.op.name for t in outputs.values()] + [t.op.name for t in heads]
+
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        yolo.sess, graph.as_graph_def(), output_names)
+    graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=input_names + output_names)
+    graph_def = TransformGraph(graph_def, input_names, output_names, transforms)
+    with tf.gfile.GFile(output_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+
+    metadata = {
+        'config': {
+            'score': yolo.score,
+            'iou': yolo.iou,
+            'max_boxes': yolo.max_boxes,
+            'model_image_size': yolo.model_image_size,
+            'nms_mode': yolo.nms_mode,
+            'pre_nms_top_k': yolo.pre_nms_top_k,
+            'precision': yolo.precision,
+        },
+        'class_names': yolo.class_names,
+        'anchors': yolo.anchors.tolist(),
+        'tensors': dict({name: t.name for name, t in outputs.items()},
+                        input=yolo.input_tensor.name,
+                        image_shape=yolo.input_image_shape.name,
+                        score=yolo.score_input.name,
+                        iou=yolo.iou_input.name,
+                        max_boxes=yolo.max_boxes_input.name,
+                        class_mask=yolo.class_mask_input.name,
+                        heads=[t.name for t in heads]),
+    }
+    metadata_path = os.path.splitext(output_path)[0] + '.json'
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a frozen YOLOv3 inference graph.')
+    parser.add_argument('output_path', help='Path to output GraphDef (.pb) file.')
+    parser.add_argument('--score', type=float, default=0.3)
+    parser.add_argument('--iou', type=float, default=0.45)
+    parser.add_argument('--nms_mode', choices=['per_class', 'offset'], default='per_class')
+    args = parser.parse_args()
+
+    # Build the model in inference mode, so BatchNormalization has no training branch.
+    K.set_learning_phase(0)
+    from .yolo import YOLO
+    yolo = YOLO(score=args.score, iou=args.iou, nms_mode=args.nms_mode)
+    metadata_path = export_frozen(yolo, args.output_path)
+    print('Frozen graph written to {} ({})'.format(args.output_path, metadata_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Low-overhead latency histograms and counters for YOLO inference, with pluggable exporters
+
+    yolo = YOLO()
+    yolo.metrics.add_exporter(PrometheusFileExporter('/var/lib/node_exporter/yolo.prom'))
+    yolo.metrics.start_export_thread(interval=15)
+
+Every detector owns a `Metrics` instance recording per-stage latencies
+(preprocess, session_run, decode for the NumPy backend, postprocess, render,
+and warmup and first_request once) and frame/box counters.
+Recording is a lock, a bisect and two additions; exporting happens on demand
+or on a background thread.
+"""
+
+import bisect
+import logging
+import os
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+
+class Histogram(object):
+    """Prometheus-style histogram with fixed upper bounds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, an estimate good enough for logs"""
+        if self.count == 0:
+            return 0.
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets + (float('inf'),), self.cumulative_counts()):
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics(object):
+    """
+    Stage latency histograms and counters of one detector
+    Args:
+        prefix (str): metric name prefix
+        labels (dict): (optional) constant labels added to every exported series, e.g. {'model': 'yolov3'}
+    """
+    stages = ('preprocess', 'session_run', 'decode', 'postprocess', 'render')
+    counter_names = ('frames', 'boxes')
+
+    def __init__(self, prefix='yolo', labels=None):
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self.histograms = {stage: Histogram() for stage in self.stages}
+        self.counters = {name: 0 for name in self.counter_names}
+        self.exporters = []
+        self._lock = threading.Lock()
+        self._export_thread = None
+        self._stop = threading.Event()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _label_str(self, extra=None):
+        labels = dict(self.labels, **(extra or {}))
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())) + '}'
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            name = '{}_stage_seconds'.format(self.prefix)
+            lines.append('# HELP {} Latency of each detection stage in seconds.'.format(name))
+            lines.append('# TYPE {} histogram'.format(name))
+            for stage, histogram in sorted(self.histograms.items()):
+                bounds = ['{:g}'.format(b) for b in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    lines.append('{}_bucket{} {}'.format(name, self._label_str({'stage': stage, 'le': bound}), count))
+                lines.append('{}_sum{} {:.9g}'.format(name, self._label_str({'stage': stage}), histogram.sum))
+                lines.append('{}_count{} {}'.format(name, self._label_str({'stage': stage}), histogram.count))
+            for counter, value in sorted(self.counters.items()):
+                counter_name = '{}_{}_total'.format(self.prefix, counter)
+                lines.append('# TYPE {} counter'.format(counter_name))
+                lines.append('{}{} {}'.format(counter_name, self._label_str(), value))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Counters and mean/p50/p99 latency per stage, as a dict"""
+        with self._lock:
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                if histogram.count:
+                    stages[stage] = {'count': histogram.count,
+                                     'mean_ms': histogram.sum / histogram.count * 1e3,
+                                     'p50_ms': histogram.quantile(.5) * 1e3,
+                                     'p99_ms': histogram.quantile(.99) * 1e3}
+            return {'counters': dict(self.counters), 'stages': stages}
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        return exporter
+
+    def export(self):
+        """Push the current metrics to every exporter"""
+        for exporter in self.exporters:
+            try:
+                exporter.export(self)
+            except Exception:
+                LOGGER.exception('metrics export to {} failed'.format(exporter))
+
+    def start_export_thread(self, interval=15.):
+        """Call `export` every `interval` seconds on a daemon thread"""
+        def loop():
+            while not self._stop.wait(interval):
+                self.export()
+        self._export_thread = threading.Thread(target=loop, name='yolo-metrics-export', daemon=True)
+        self._export_thread.start()
+
+    def stop_export_thread(self):
+        self._stop.set()
+        if self._export_thread is not None:
+            self._export_thread.join()
+            self._export_thread = None
+        self._stop.clear()
+
+
+class PrometheusFileExporter(object):
+    """Writes the Prometheus text format to a file, atomically, e.g. for the node_exporter textfile collector"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, metrics):
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(metrics.prometheus_text())
+        os.replace(tmp_path, self.path)
+
+
+class PrometheusHTTPExporter(object):
+    """
+    Serves the Prometheus text format at http://host:port/metrics from a daemon thread
+    Args:
+        metrics (Metrics): metrics to serve, rendered on every scrape
+    """
+
+    def __init__(self, metrics, port=9100, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='yolo-metrics-http', daemon=True)
+        self.thread.start()
+
+    def export(self, metrics):
+        pass  # pull based: rendered on scrape
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LoggingExporter(object):
+    """Logs the `Metrics.summary` on every export"""
+
+    def __init__(self, logger=LOGGER, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def export(self, metrics):
+        summary = metrics.summary()
+        stages = ', '.join('{} mean {:.1f} ms p99 <= {:.1f} ms'.format(stage, s['mean_ms'], s['p99_ms'])
+                           for stage, s in sorted(summary['stages'].items()))
+        self.logger.log(self.level, 'frames {frames} boxes {boxes}'.format(**summary['counters']) +
+                        (' | ' + stages if stages else ''))
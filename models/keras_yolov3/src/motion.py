@@ -0,0 +1,82 @@
+"""
+Motion gating: skip detection on frames that barely differ from the last detected one
+
+Frames are shrunk to a small grey thumbnail and compared to the thumbnail of
+the last frame the detector ran on. The score is the fraction of thumbnail
+pixels that changed by more than `pixel_threshold`, so sensor noise does not
+count as motion while a small moving object does. Comparing with the last
+detected frame rather than the previous one lets slow changes add up.
+"""
+
+import numpy as np
+import cv2
+
+
+class MotionGate(object):
+    """
+    Decides per frame whether the detector needs to run
+    Args:
+        threshold (float): changed pixel fraction above which a frame is detected on
+        max_staleness (int): frames the previous detections may be reused for before forcing a refresh
+        pixel_threshold (int): grey level difference for a thumbnail pixel to count as changed
+        thumbnail_width (int): width of the thumbnail the frames are compared at
+        metrics (Metrics): (optional) counts 'gated_frames' and 'skipped_frames' in it
+    """
+
+    def __init__(self, threshold=.005, max_staleness=30, pixel_threshold=25, thumbnail_width=80, metrics=None):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self.pixel_threshold = pixel_threshold
+        self.thumbnail_width = thumbnail_width
+        self.metrics = metrics
+        self.frames = 0
+        self.skipped = 0
+        self.last_score = None
+        self._reference = None
+        self._thumbnail = None
+        self._staleness = 0
+
+    def _thumbnail_of(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.thumbnail_width, max(1, height * self.thumbnail_width // width))
+        if self._thumbnail is None or self._thumbnail.shape[:2] != (size[1], size[0]):
+            self._thumbnail = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._reference = None
+        cv2.resize(frame, size, dst=self._thumbnail, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(self._thumbnail, cv2.COLOR_BGR2GRAY)
+
+    def score(self, frame):
+        """Changed pixel fraction of `frame` against the last detected frame, 1 when there is none"""
+        grey = self._thumbnail_of(frame)
+        if self._reference is None:
+            return 1., grey
+        changed = cv2.absdiff(grey, self._reference) > self.pixel_threshold
+        return float(np.count_nonzero(changed)) / changed.size, grey
+
+    def check(self, frame):
+        """
+        Whether to run the detector on `frame`; when False the previous detections should be reused
+        Args:
+            frame (np.array): uint8 image of shape (height, width, 3)
+
+        Returns:
+            bool: True when the frame moved enough, or the previous detections are too old
+        """
+        self.frames += 1
+        self.last_score, grey = self.score(frame)
+        if self.last_score > self.threshold or self._staleness >= self.max_staleness:
+            self._reference = grey
+            self._staleness = 0
+            if self.metrics is not None:
+                self.metrics.inc('gated_frames')
+            return True
+        self._staleness += 1
+        self.skipped += 1
+        if self.metrics is not None:
+            self.metrics.inc('gated_frames')
+            self.metrics.inc('skipped_frames')
+        return False
+
+    def reset(self):
+        """Force detection on the next frame, e.g. after a scene cut"""
+        self._reference = None
@@ -0,0 +1,326 @@
+"""
+Threaded video detection pipeline: capture -> preprocess -> inference -> render -> write
+
+Every stage runs in its own thread and hands frames to the next one through a
+bounded queue, so decoding, inference and encoding overlap and the wall time of
+a file-to-file run approaches the inference time alone. Frames are decoded into
+a `FrameRing` slot and drawn on in place, so frames are not reallocated or
+copied between stages.
+"""
+
+import queue
+import threading
+from timeit import default_timer as timer
+
+import numpy as np
+import cv2
+
+from .yolo3.utils import letterbox_array
+from .ringbuffer import FrameRing
+
+_END = object()  # end-of-stream marker passed down the pipeline
+
+
+class StageTimer(object):
+    """Accumulates the busy time of one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.
+        return {'frames': self.count, 'total_s': self.total, 'mean_ms': mean * 1e3, 'max_ms': self.max * 1e3}
+
+
+class BoundedQueue(object):
+    """
+    Queue between two stages
+    Args:
+        maxsize (int): capacity
+        backpressure (str): 'block' makes a full queue stall the producer,
+            'drop_oldest' discards the oldest queued item to make room
+        on_drop (callable): (optional) called with every discarded item
+    """
+
+    def __init__(self, maxsize, backpressure='block', on_drop=None):
+        assert backpressure in ('block', 'drop_oldest'), 'Unknown backpressure {}'.format(backpressure)
+        self._queue = queue.Queue(maxsize)
+        self.backpressure = backpressure
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        if self.backpressure == 'block' or item is _END:
+            self._queue.put(item)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    oldest = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                if oldest is _END:  # never lose the end of stream
+                    self._queue.put(oldest)
+                    continue
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(oldest)
+
+    def get(self):
+        return self._queue.get()
+
+
+class VideoPipeline(object):
+    """
+    Detect objects on every frame of a video source
+    Args:
+        yolo (YOLO): detector
+        source: video file path or webcam id, as accepted by cv2.VideoCapture
+        output_path (str): (optional) annotated video to write
+        display (bool): show annotated frames in a window
+        queue_size (int): capacity of every inter-stage queue
+        backpressure (str): 'block' or 'drop_oldest', see `BoundedQueue`
+        render (bool): draw detections on the frames (default: the detector's `render` option)
+        on_detections (callable): (optional) called with (frame index, detections) for every frame
+        keyframe_interval (int): (optional) detect on every n-th frame only and track boxes in between,
+            see `tracker.KeyframeDetector`
+        motion_gate (MotionGate): (optional) skip preprocessing and inference on frames it finds static,
+            reusing the previous detections
+    """
+    stages = ('capture', 'preprocess', 'inference', 'render', 'write')
+
+    def __init__(self, yolo, source, output_path=None, display=False, queue_size=8,
+                 backpressure='block', render=None, on_detections=None, keyframe_interval=None,
+                 motion_gate=None):
+        self.yolo = yolo
+        self.source = source
+        self.output_path = output_path
+        self.display = display
+        self.render = yolo.render if render is None else render
+        self.on_detections = on_detections
+        self.motion_gate = motion_gate
+        self.keyframes = None
+        if keyframe_interval is not None:
+            from .tracker import KeyframeDetector
+            self.keyframes = KeyframeDetector(yolo, interval=keyframe_interval)
+        self.timers = {name: StageTimer(name) for name in self.stages}
+        # Preprocessed input buffers are recycled once inference is done with them.
+        self._free_buffers = queue.Queue()
+        self._num_buffers = queue_size + 2
+        # Enough frame slots for every queue and stage to hold one at the same time.
+        self._num_slots = 4 * queue_size + 5
+        self.ring = None
+        self.queues = {
+            'preprocess': BoundedQueue(queue_size, backpressure, on_drop=self._recycle),
+            'inference': BoundedQueue(queue_size, backpressure, on_drop=self._recycle),
+            'render': BoundedQueue(queue_size, backpressure, on_drop=self._recycle),
+            'write': BoundedQueue(queue_size, backpressure, on_drop=self._recycle),
+        }
+        self._stop = threading.Event()
+        self._error = None
+
+    def _recycle(self, item):
+        """Give back the frame slot and input buffer of a dropped item"""
+        _, slot, extra = item
+        self.ring.release(slot)
+        if isinstance(extra, np.ndarray):
+            self._free_buffers.put(extra)
+
+    def _buffer(self, shape):
+        if self._num_buffers > 0:
+            self._num_buffers -= 1
+            return np.empty(shape, dtype=self.yolo.precision)
+        buffer = self._free_buffers.get()
+        if buffer.shape != shape:
+            # Left over from before a resolution switch.
+            buffer = np.empty(shape, dtype=self.yolo.precision)
+        return buffer
+
+    def _run_stage(self, source, target, body, *args):
+        """
+        Run a stage thread body, then pass the end of stream on to the `target` queue
+        Args:
+            source (str): input queue of the stage, None for capture
+            target (str): output queue of the stage
+            body (callable): stage loop, called with `args`
+
+        On failure the error is kept for `run` to raise, the other stages are told to stop and
+        the input queue is drained, so that upstream stages blocked on it can finish.
+        """
+        try:
+            body(*args)
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+            if source is not None:
+                while True:
+                    item = self.queues[source].get()
+                    if item is _END:
+                        break
+                    self._recycle(item)
+        finally:
+            self.queues[target].put(_END)
+
+    def _capture(self, vid, first_slot):
+        self.queues['preprocess'].put((0, first_slot, None))
+        index = 1
+        while not self._stop.is_set():
+            start = timer()
+            slot = self.ring.read(vid)
+            if slot is None:
+                break
+            self.timers['capture'].add(timer() - start)
+            self.queues['preprocess'].put((index, slot, None))
+            index += 1
+
+    def _preprocess(self):
+        yolo = self.yolo
+        while True:
+            item = self.queues['preprocess'].get()
+            if item is _END:
+                break
+            index, slot, _ = item
+            frame = self.ring.frames[slot]
+            if self.motion_gate is not None and not self.motion_gate.check(frame):
+                self.queues['inference'].put((index, slot, None))
+                continue
+            width, height = yolo._input_size(frame)
+            buffer = self._buffer((1, height, width, 3))
+            start = timer()
+            letterbox_array(frame, (width, height), out=buffer[0],
+                            interpolation=yolo.interpolation, swap_rb=True)
+            self.timers['preprocess'].add(timer() - start)
+            self.queues['inference'].put((index, slot, buffer))
+
+    def _inference(self):
+        yolo = self.yolo
+        detections = []
+        while True:
+            item = self.queues['inference'].get()
+            if item is _END:
+                break
+            index, slot, buffer = item
+            image_shapes = [list(self.ring.shape[:2])]
+
+            def detect():
+                # Only frames the model actually ran on are timed and steer the resolution.
+                start = timer()
+                batch = yolo._to_detection_batches(yolo._run(buffer, image_shapes), image_shapes)[0]
+                self.timers['inference'].add(timer() - start)
+                yolo._adapt_resolution(timer() - start)
+                return batch
+
+            if buffer is not None:  # None when the motion gate kept the previous detections
+                if self.keyframes is not None:
+                    detections = self.keyframes.update(image_shapes[0], detect).to_detections()
+                else:
+                    detections = detect().to_detections()
+                self._free_buffers.put(buffer)
+            if self.on_detections is not None:
+                self.on_detections(index, detections)
+            self.queues['render'].put((index, slot, detections))
+
+    def _render(self):
+        frames = 0
+        fps = 'FPS: ??'
+        window_start = timer()
+        while True:
+            item = self.queues['render'].get()
+            if item is _END:
+                break
+            index, slot, detections = item
+            frame = self.ring.frames[slot]
+            start = timer()
+            if self.render:
+                self.yolo.draw_detections(frame, detections, in_place=True)
+                cv2.putText(frame, text=fps, org=(3, 15), fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                            fontScale=0.50, color=(255, 0, 0), thickness=2)
+            self.timers['render'].add(timer() - start)
+            if self.render:
+                self.yolo.metrics.observe('render', timer() - start)
+            frames += 1
+            if timer() - window_start > 1:
+                fps = 'FPS: {}'.format(frames)
+                frames = 0
+                window_start = timer()
+            self.queues['write'].put((index, slot, detections))
+
+    def run(self):
+        """
+        Process the whole source; writing and display happen on the calling thread
+        Returns:
+            dict: wall time, processed and dropped frame counts and per-stage timing
+
+        An exception raised in any stage stops the pipeline and is raised here.
+        """
+        vid = cv2.VideoCapture(self.source)
+        if not vid.isOpened():
+            raise IOError("Couldn't open webcam or video")
+        self.ring, first_slot = FrameRing.from_capture(vid, self._num_slots)
+        if self.ring is None:
+            vid.release()
+            raise IOError("Couldn't read from webcam or video")
+        video_size = (self.ring.shape[1], self.ring.shape[0])
+        out = None
+        if self.output_path:
+            out = cv2.VideoWriter(self.output_path, int(vid.get(cv2.CAP_PROP_FOURCC)),
+                                  vid.get(cv2.CAP_PROP_FPS), video_size)
+        threads = [threading.Thread(target=self._run_stage, args=(None, 'preprocess', self._capture, vid, first_slot),
+                                    name='capture', daemon=True),
+                   threading.Thread(target=self._run_stage, args=('preprocess', 'inference', self._preprocess),
+                                    name='preprocess', daemon=True),
+                   threading.Thread(target=self._run_stage, args=('inference', 'render', self._inference),
+                                    name='inference', daemon=True),
+                   threading.Thread(target=self._run_stage, args=('render', 'write', self._render),
+                                    name='render', daemon=True)]
+        start = timer()
+        for thread in threads:
+            thread.start()
+        if self.display:
+            cv2.namedWindow("result", cv2.WINDOW_NORMAL)
+        while True:
+            item = self.queues['write'].get()
+            if item is _END:
+                break
+            _, slot, _ = item
+            frame = self.ring.frames[slot]
+            write_start = timer()
+            if out is not None:
+                out.write(frame)
+            if self.display:
+                cv2.imshow("result", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self._stop.set()
+            self.timers['write'].add(timer() - write_start)
+            self.ring.release(slot)
+        for thread in threads:
+            thread.join()
+        wall_time = timer() - start
+        vid.release()
+        if out is not None:
+            out.release()
+        if self.display:
+            cv2.destroyWindow("result")
+        self.ring.close()
+        if self._error is not None:
+            raise self._error
+        return {
+            'wall_s': wall_time,
+            'frames': self.timers['write'].count,
+            'dropped': sum(q.dropped for q in self.queues.values()),
+            'skipped': self.motion_gate.skipped if self.motion_gate is not None else 0,
+            'keyframes': self.keyframes.keyframes if self.keyframes is not None else self.timers['inference'].count,
+            'stages': {name: self.timers[name].as_dict() for name in self.stages},
+        }
@@ -0,0 +1,236 @@
+"""
+Multi-process CPU inference: one YOLO session per worker process, frames and
+results exchanged through `multiprocessing.shared_memory` (Python 3.8+).
+
+    with YOLOPool(num_workers=4) as pool:
+        detections = pool.detect(frame)
+        batch = pool.detect_batch(frames)  # spread over the workers
+
+Only slot numbers and shapes travel through the task/result queues; pixels are
+copied once into a shared input slot, and boxes come back in a shared result slot.
+"""
+
+import os
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .detection import Detection
+
+RESULT_FIELDS = 6  # x1, y1, x2, y2, score, class
+POLL_INTERVAL = 1.  # seconds between checks that the workers are still alive
+
+
+def _worker(worker_id, yolo_kwargs, intra_op_threads, cpus, task_queue, result_queue,
+            frame_names, result_names, max_boxes):
+    """Worker process main loop"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    import tensorflow as tf
+    from keras import backend as K
+    K.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                                                   inter_op_parallelism_threads=1)))
+    try:
+        from .yolo import YOLO
+        yolo = YOLO(**yolo_kwargs)
+        frames = [shared_memory.SharedMemory(name=name) for name in frame_names]
+        results = [shared_memory.SharedMemory(name=name) for name in result_names]
+    except Exception:
+        result_queue.put(('error', worker_id, traceback.format_exc()))
+        return
+    result_queue.put(('ready', worker_id, yolo.class_names, yolo.colors))
+    image = out = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            slot, shape = task
+            image = np.ndarray(shape, dtype=np.uint8, buffer=frames[slot].buf)
+            try:
+                batch = yolo.detect_columnar(image)
+            except Exception as e:
+                result_queue.put(('error', slot, repr(e)))
+                continue
+            out = np.ndarray((max_boxes, RESULT_FIELDS), dtype=np.float32, buffer=results[slot].buf)
+            n = min(len(batch), max_boxes)
+            out[:n, :4] = batch.boxes[:n]
+            out[:n, 4] = batch.scores[:n]
+            out[:n, 5] = batch.class_ids[:n]
+            result_queue.put(('done', slot, n))
+    finally:
+        image = out = None  # release the views before closing the shared memory
+        for shm in frames + results:
+            shm.close()
+        yolo.close_session()
+
+
+class YOLOPool(object):
+    """
+    Pool of worker processes, each holding its own YOLO session
+    Args:
+        num_workers (int): worker processes (default: one per 4 cores)
+        threads_per_worker (int): intra-op threads of every session (default: cores / num_workers)
+        pin_cpus (bool): pin every worker to its own set of cores (Linux)
+        max_image_shape (tuple): largest (height, width, 3) uint8 frame accepted
+        max_boxes (int): detections returned per frame at most
+        **yolo_kwargs: passed to `YOLO` in every worker
+    """
+
+    def __init__(self, num_workers=None, threads_per_worker=None, pin_cpus=False,
+                 max_image_shape=(1080, 1920, 3), max_boxes=256, **yolo_kwargs):
+        num_cpus = os.cpu_count() or 1
+        self.num_workers = num_workers or max(1, num_cpus // 4)
+        self.threads_per_worker = threads_per_worker or max(1, num_cpus // self.num_workers)
+        self.max_image_shape = tuple(max_image_shape)
+        self.max_boxes = max_boxes
+        num_slots = 2 * self.num_workers
+        self._frames = [shared_memory.SharedMemory(create=True, size=int(np.prod(self.max_image_shape)))
+                        for _ in range(num_slots)]
+        self._results = [shared_memory.SharedMemory(create=True, size=max_boxes * RESULT_FIELDS * 4)
+                         for _ in range(num_slots)]
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._futures = {}
+        self._failure = None
+        self._closing = False
+
+        ctx = mp.get_context('spawn')  # TensorFlow is not fork safe
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._workers = []
+        for worker_id in range(self.num_workers):
+            cpus = None
+            if pin_cpus:
+                cpus = set(range(worker_id * self.threads_per_worker,
+                                 (worker_id + 1) * self.threads_per_worker)) & set(range(num_cpus))
+            worker = ctx.Process(target=_worker, name='yolo-worker-{}'.format(worker_id), daemon=True, args=(
+                worker_id, yolo_kwargs, self.threads_per_worker, cpus, self._task_queue, self._result_queue,
+                [shm.name for shm in self._frames], [shm.name for shm in self._results], max_boxes))
+            worker.start()
+            self._workers.append(worker)
+        try:
+            for _ in range(self.num_workers):
+                kind, worker_id, *payload = self._next_message()
+                if kind == 'error':
+                    raise RuntimeError('YOLO worker {} failed to start:\n{}'.format(worker_id, payload[0]))
+                self.class_names, self.colors = payload
+        except BaseException:
+            self._terminate()
+            raise
+        self._collector = threading.Thread(target=self._collect, name='yolo-pool-collector', daemon=True)
+        self._collector.start()
+
+    def _dead_workers(self):
+        return [worker.name for worker in self._workers if not worker.is_alive()]
+
+    def _next_message(self):
+        """Next result queue message; raises when a worker died instead of waiting forever"""
+        while True:
+            try:
+                return self._result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                dead = self._dead_workers()
+                if dead and not self._closing:
+                    raise RuntimeError('YOLO worker(s) {} exited'.format(', '.join(dead)))
+
+    def _terminate(self):
+        """Stop the workers and free the shared memory, after a failed start"""
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+        for shm in self._frames + self._results:
+            shm.close()
+            shm.unlink()
+
+    def _fail_pending(self, error):
+        """Resolve every pending future with `error`; the pool accepts no new frames after this"""
+        self._failure = error
+        for slot in list(self._futures):
+            future = self._futures.pop(slot, None)
+            if future is not None:
+                future.set_exception(error)
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._next_message()
+            except RuntimeError as e:
+                # Which frames the dead worker held is unknown, so none of them will resolve.
+                self._fail_pending(e)
+                break
+            if message is None:
+                break
+            kind, slot, payload = message
+            future = self._futures.pop(slot, None)
+            if future is None:
+                pass  # already failed
+            elif kind == 'error':
+                future.set_exception(RuntimeError(payload))
+            else:
+                out = np.ndarray((self.max_boxes, RESULT_FIELDS), dtype=np.float32,
+                                 buffer=self._results[slot].buf)[:payload].copy()
+                future.set_result([Detection(bbox=row[:4],
+                                             label=self.class_names[int(row[5])],
+                                             color=self.colors[int(row[5])],
+                                             score=float(row[4])) for row in out])
+            self._free_slots.put(slot)
+
+    def submit(self, image):
+        """
+        Queue detection of one RGB uint8 np.array on the next free worker
+        Returns:
+            concurrent.futures.Future: resolves to a list of `Detection` objects
+        """
+        image = np.asarray(image, dtype=np.uint8)
+        if image.nbytes > self._frames[0].size:
+            raise ValueError('image of shape {} exceeds max_image_shape {}'.format(
+                image.shape, self.max_image_shape))
+        slot = None
+        while slot is None:
+            if self._failure is not None:
+                raise self._failure
+            try:
+                slot = self._free_slots.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        np.ndarray(image.shape, dtype=np.uint8, buffer=self._frames[slot].buf)[...] = image
+        future = Future()
+        self._futures[slot] = future
+        if self._failure is not None:  # the collector gave up meanwhile
+            self._fail_pending(self._failure)
+        self._task_queue.put((slot, image.shape))
+        return future
+
+    def detect(self, image):
+        """Same as `YOLO.detect`, run on a worker process"""
+        return self.submit(image).result()
+
+    def detect_batch(self, images):
+        """Same as `YOLO.detect_batch`, with the images spread over the workers"""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._closing = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._result_queue.put(None)
+        self._collector.join()
+        for shm in self._frames + self._results:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,74 @@
+"""
+Registry of loaded YOLO models shared between detector configurations
+
+    registry = ModelRegistry()
+    people = YOLO(registry=registry, score=.5)
+    anything = YOLO(registry=registry, score=.2, iou=.3)  # no second copy of the weights
+
+Detectors built with the same registry, weights, anchors, classes and graph
+options (fold_batchnorm, precision, postprocess, nms_mode, pre_nms_top_k)
+share one Keras model, one `yolo_eval` graph and the session. Score and IoU
+thresholds, max_boxes and the class filter are graph inputs fed by each
+detector, so they may differ freely. `YOLO.close_session` releases a
+detector's model but leaves the Keras session open, since every model lives in it.
+"""
+
+import threading
+
+
+class ModelRegistry(object):
+    """Reference-counted models, built on first use by the detector asking for them"""
+
+    def __init__(self):
+        self._models = {}
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._models)
+
+    def acquire(self, key, build):
+        """
+        Model registered under `key`, built with `build()` when there is none yet
+        Args:
+            key (tuple): hashable description of everything the model graph depends on
+            build (callable): returns the model, e.g. the dict `YOLO._build_model` returns
+
+        Returns:
+            the shared model
+        """
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = build()
+                self._refs[key] = 0
+            self._refs[key] += 1
+            return self._models[key]
+
+    def release(self, key):
+        """
+        Drop one reference to a model
+        Returns:
+            int: references left; the model is forgotten at 0
+        """
+        with self._lock:
+            self._refs[key] -= 1
+            refs = self._refs[key]
+            if refs == 0:
+                # TF1 variables live as long as their graph, only the Python references go.
+                del self._models[key], self._refs[key]
+            return refs
+
+    def refs(self, key):
+        with self._lock:
+            return self._refs.get(key, 0)
+
+
+_default_registry = None
+
+
+def default_registry():
+    """Process-wide registry, for detectors created with `registry=True`"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ModelRegistry()
+    return _default_registry
@@ -0,0 +1,101 @@
+"""
+Annotated rendering of detections with cv2
+
+Boxes are drawn with a single `cv2.rectangle` call each, and label patches
+(background plus text) are rendered once per (text, color, size) and then
+copied into the frame from a bounded cache.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class Renderer(object):
+    """
+    Draws detections on uint8 images
+    Args:
+        thickness (int): box line width (default: scales with the image size)
+        font_scale (float): label font scale (default: scales with the image height)
+        text_color (tuple): label text color, drawn on a patch of the box color
+        enabled (bool): when False, `draw` leaves the image untouched
+        cache_size (int): label patches kept in the cache
+    """
+
+    def __init__(self, thickness=None, font_scale=None, text_color=(0, 0, 0), enabled=True, cache_size=4096):
+        self.thickness = thickness
+        self.font_scale = font_scale
+        self.text_color = text_color
+        self.enabled = enabled
+        self.cache_size = cache_size
+        self._labels = OrderedDict()
+
+    def _style(self, shape):
+        height, width = shape[:2]
+        thickness = self.thickness or max(1, (width + height) // 600)
+        font_scale = self.font_scale or max(0.4, 1e-3 * height)
+        return thickness, font_scale
+
+    def label_patch(self, text, color, font_scale):
+        """Label image of `text` on a `color` background, from the cache when possible"""
+        key = (text, color, font_scale)
+        patch = self._labels.get(key)
+        if patch is not None:
+            self._labels.move_to_end(key)
+            return patch
+        text_thickness = max(1, int(round(font_scale)))
+        (text_width, text_height), baseline = cv2.getTextSize(text, FONT, font_scale, text_thickness)
+        patch = np.empty((text_height + baseline + 2, text_width + 2, 3), dtype=np.uint8)
+        patch[...] = color
+        cv2.putText(patch, text, (1, text_height + 1), FONT, font_scale, self.text_color, text_thickness, cv2.LINE_AA)
+        self._labels[key] = patch
+        if len(self._labels) > self.cache_size:
+            self._labels.popitem(last=False)
+        return patch
+
+    def draw(self, img, detections, out=None):
+        """
+        Draw boxes and labels
+        Args:
+            img (np.array): uint8 image of shape (height, width, 3)
+            detections: iterable of `Detection` objects, or a `DetectionBatch`
+            out (np.array): buffer to draw into; `img` itself draws in place, None draws on a copy
+
+        Returns:
+            np.array: the annotated image (`out` when given)
+        """
+        if out is None:
+            out = img.copy()
+        elif out is not img:
+            np.copyto(out, img)
+        if not self.enabled:
+            return out
+        height, width = out.shape[:2]
+        thickness, font_scale = self._style(out.shape)
+        for det in detections:
+            color = tuple(int(c) for c in det.color)
+            cv2.rectangle(out, (det.x1, det.y1), (det.x2, det.y2), color, thickness)
+            patch = self.label_patch('{} {:.2f}'.format(det.label, det.score), color, font_scale)
+            patch_height, patch_width = patch.shape[:2]
+            # Above the box when there is room, inside it otherwise.
+            top = det.y1 - patch_height if det.y1 - patch_height >= 0 else det.y1 + 1
+            left = max(0, det.x1)
+            bottom = min(height, top + patch_height)
+            right = min(width, left + patch_width)
+            if bottom > top and right > left:
+                out[top:bottom, left:right] = patch[:bottom - top, :right - left]
+        return out
+
+
+_default_renderer = None
+
+
+def default_renderer():
+    """Renderer shared by `YOLO.draw_detections` and `YOLO.detect_image`"""
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = Renderer()
+    return _default_renderer
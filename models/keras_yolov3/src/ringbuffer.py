@@ -0,0 +1,130 @@
+"""
+Preallocated ring of frame slots shared by capture, preprocessing and drawing
+
+Capture decodes straight into a free slot with `VideoCapture.read(image=...)`,
+downstream stages read and draw on the slot in place, and the last stage hands
+it back with `release`. No per-frame allocation happens in steady state.
+The slots can live in `multiprocessing.shared_memory` so that other processes
+can attach to them by name.
+"""
+
+import threading
+
+import numpy as np
+
+
+class FrameRing(object):
+    """
+    Fixed number of equally shaped frame slots
+    Args:
+        num_slots (int): frames that can be in flight at once
+        shape (tuple): (height, width, channels) of every frame
+        dtype: pixel type
+        shared (bool): back the slots with shared memory (Python 3.8+)
+        name (str): attach to the existing shared memory block of that name instead of creating one
+    """
+
+    def __init__(self, num_slots, shape, dtype=np.uint8, shared=False, name=None):
+        self.num_slots = num_slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._shm = None
+        buffer = None
+        if shared or name is not None:
+            from multiprocessing import shared_memory
+            size = num_slots * int(np.prod(self.shape)) * self.dtype.itemsize
+            self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            buffer = self._shm.buf
+        self.frames = np.ndarray((num_slots,) + self.shape, dtype=self.dtype, buffer=buffer)
+        self._owner = name is None
+        self._held = [False] * num_slots
+        self._next = 0
+        self._cond = threading.Condition()
+
+    @property
+    def name(self):
+        """Shared memory block name to `attach` to from another process, None when not shared"""
+        return self._shm.name if self._shm is not None else None
+
+    @classmethod
+    def from_capture(cls, capture, num_slots, **kwargs):
+        """
+        Ring sized from the first frame of a cv2.VideoCapture, since backends may report
+        no frame size (0) or another one than they decode
+        Args:
+            capture (cv2.VideoCapture): opened source
+            num_slots (int): frames that can be in flight at once
+            **kwargs: shared and name, see `FrameRing`
+
+        Returns:
+            tuple: the ring and the slot holding the first frame, or (None, None) for an empty stream
+        """
+        return_value, image = capture.read()
+        if not return_value:
+            return None, None
+        ring = cls(num_slots, image.shape, dtype=image.dtype, **kwargs)
+        slot = ring.acquire()
+        ring.frames[slot] = image
+        return ring, slot
+
+    @classmethod
+    def attach(cls, name, num_slots, shape, dtype=np.uint8):
+        """View of a shared ring created by another process"""
+        return cls(num_slots, shape, dtype=dtype, name=name)
+
+    def acquire(self, timeout=None):
+        """
+        Take the next free slot for writing, waiting while every slot is in use
+        Returns:
+            int: slot index, or None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: not all(self._held), timeout):
+                return None
+            while self._held[self._next]:
+                self._next = (self._next + 1) % self.num_slots
+            slot = self._next
+            self._held[slot] = True
+            self._next = (slot + 1) % self.num_slots
+            return slot
+
+    def release(self, slot):
+        """Hand a slot back once the last stage is done with it"""
+        with self._cond:
+            self._held[slot] = False
+            self._cond.notify()
+
+    def read(self, capture, timeout=None):
+        """
+        Decode the next frame of a cv2.VideoCapture into a free slot
+        Returns:
+            int: slot holding the frame, or None at the end of the stream
+        """
+        slot = self.acquire(timeout)
+        if slot is None:
+            return None
+        frame = self.frames[slot]
+        return_value, image = capture.read(image=frame)
+        if not return_value:
+            self.release(slot)
+            return None
+        if image.ctypes.data != frame.ctypes.data:
+            # OpenCV reallocates when the decoded frame does not fit the slot.
+            if image.shape != frame.shape:
+                self.release(slot)
+                raise ValueError('Frame of shape {} does not fit ring slots of shape {}'.format(
+                    image.shape, frame.shape))
+            frame[...] = image
+        return slot
+
+    def in_use(self):
+        with self._cond:
+            return sum(self._held)
+
+    def close(self):
+        self.frames = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
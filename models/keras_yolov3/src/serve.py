@@ -0,0 +1,258 @@
+"""
+Local HTTP detection service with dynamic micro-batching
+
+    python -m models.keras_yolov3.src.serve --port 8080 --max-batch-size 8 --max-wait-ms 10
+
+Endpoints:
+    POST /detect   body: an encoded image (JPEG, PNG, ...), or raw RGB bytes with
+                   `?width=W&height=H` in the query string. Returns JSON detections.
+    GET  /health   returns 200 once the detector is loaded and warmed up, 503 before.
+
+Concurrent requests are collected into batches of at most `max_batch_size`
+images, waiting at most `max_wait_ms` after the first one, and every batch is
+run through a single `YOLO.detect_batch` call.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import cv2
+
+from .cache import bytes_key
+
+LOGGER = logging.getLogger(__name__)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class MicroBatcher(object):
+    """
+    Groups concurrent detection requests into batches for one detector
+    Args:
+        yolo (YOLO): detector with a fixed `model_image_size`
+        max_batch_size (int): largest batch passed to `detect_batch`
+        max_wait_ms (float): how long the first request of a batch waits for company
+    """
+
+    def __init__(self, yolo, max_batch_size=8, max_wait_ms=10.):
+        self.yolo = yolo
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.batch_sizes = []
+        self._queue = asyncio.Queue()
+        # The session runs on one thread, off the event loop.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def detect(self, image, cache_key=None):
+        """
+        Detect objects on an RGB np.array, sharing the session call with concurrent requests
+        Args:
+            cache_key (str): (optional) result cache key, e.g. `cache.bytes_key` of the request body
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((image, cache_key, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await self._detect_batch(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    LOGGER.exception('detection failed')
+                    _set_exception(batch[0][2], e)
+                    continue
+                # One bad image must not fail the requests it was batched with.
+                LOGGER.warning('batch of {} failed, retrying its images one by one'.format(len(batch)))
+                for item in batch:
+                    try:
+                        detections, = await self._detect_batch([item])
+                    except Exception as e:
+                        LOGGER.exception('detection failed')
+                        _set_exception(item[2], e)
+                    else:
+                        _set_result(item[2], detections)
+                continue
+            for (_, _, future), detections in zip(batch, results):
+                _set_result(future, detections)
+
+    async def _detect_batch(self, batch):
+        """Run `detect_batch` on the executor for a list of queued (image, cache_key, future) items"""
+        images = [image for image, _, _ in batch]
+        cache_keys = [key for _, key, _ in batch]
+        detect = self.yolo.detect_batch
+        if None not in cache_keys:
+            detect = functools.partial(detect, cache_keys=cache_keys)
+        return await asyncio.get_event_loop().run_in_executor(self._executor, detect, images)
+
+
+def _set_result(future, result):
+    if not future.done():  # the client may have gone away
+        future.set_result(result)
+
+
+def _set_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+
+
+def decode_image(body, query):
+    """
+    Decode a request body to an RGB np.array
+    Args:
+        body (bytes): encoded image, or raw RGB pixels when width and height are given
+        query (dict): parsed query string
+
+    Returns:
+        np.array: uint8 image of shape (height, width, 3)
+    """
+    if 'width' in query and 'height' in query:
+        width, height = int(query['width'][0]), int(query['height'][0])
+        if width <= 0 or height <= 0:
+            raise ValueError('width and height must be positive')
+        if len(body) != width * height * 3:
+            raise ValueError('expected {} bytes of raw RGB, got {}'.format(width * height * 3, len(body)))
+        return np.frombuffer(body, dtype=np.uint8).reshape(height, width, 3)
+    if not body:
+        raise ValueError('empty request body')
+    try:
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error:
+        image = None  # truncated or corrupt data
+    if image is None:
+        raise ValueError('could not decode image')
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def detections_to_json(detections):
+    return [{'label': d.label, 'score': float(d.score), 'bbox': d.bbox} for d in detections]
+
+
+class DetectionServer(object):
+    """
+    Minimal HTTP/1.1 server on asyncio streams
+    Args:
+        batcher (MicroBatcher): batcher the /detect requests go through
+        max_body_bytes (int): larger request bodies are rejected
+    """
+
+    def __init__(self, batcher, max_body_bytes=32 * 1024 * 1024):
+        self.batcher = batcher
+        self.max_body_bytes = max_body_bytes
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body_bytes:
+                    await self._respond(writer, 413, {'error': 'body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.route(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except ValueError:
+            await self._respond(writer, 400, {'error': 'malformed request'}, keep_alive=False)
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/health':
+            if not getattr(self.batcher.yolo, 'ready', True):
+                return 503, {'status': 'warming up'}
+            return 200, {'status': 'ok'}
+        if url.path != '/detect':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        query = parse_qs(url.query)
+        try:
+            image = decode_image(body, query)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        cache_key = None
+        if getattr(self.batcher.yolo, 'result_cache', None) is not None:
+            # Raw pixels are only meaningful with their dimensions, so the query is part of the key.
+            cache_key = bytes_key(body, url.query.encode())
+        try:
+            detections = await self.batcher.detect(image, cache_key)
+        except Exception as e:
+            return 500, {'error': str(e)}
+        return 200, {'detections': detections_to_json(detections)}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode()
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, REASONS[status], len(body), 'keep-alive' if keep_alive else 'close')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(yolo, host='127.0.0.1', port=8080, max_batch_size=8, max_wait_ms=10.):
+    batcher = MicroBatcher(yolo, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batch_task = asyncio.ensure_future(batcher.run())
+    server = await asyncio.start_server(DetectionServer(batcher).handle, host, port)
+    LOGGER.info('serving on {}:{}'.format(host, port))
+    try:
+        await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local YOLOv3 detection service.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default=127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=10.)
+    parser.add_argument('--score', type=float, default=0.3)
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Bytes of detection results cached by request body (default=0, disabled)')
+    parser.add_argument('--cache-dir', help='Directory of the on-disk result cache tier')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    from .yolo import YOLO
+    yolo = YOLO(score=args.score, cache_size=args.cache_size, cache_dir=args.cache_dir, warmup_on_init=True,
+                warmup_batch_sizes=sorted({1, args.max_batch_size}))
+    asyncio.get_event_loop().run_until_complete(
+        serve(yolo, args.host, args.port, args.max_batch_size, args.max_wait_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+TFLite export and interpreter backend
+
+    python -m models.keras_yolov3.src.tflite yolo_int8.tflite --quantization int8 --annotations train.txt
+
+The YOLO body is converted at a fixed input size; decoding and NMS stay on the
+host in NumPy (`yolo3.postprocess`), so `YOLO.from_tflite` detectors have the
+same `detect` API as graph-backed ones.
+
+Quantization modes:
+    float32  plain conversion
+    dynamic  int8 weights, dequantized on the fly, float activations
+    int8     int8 weights and activations calibrated on images from an annotation
+             file, float kernels where no int8 one exists
+    float16  float16 weights
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+QUANTIZATIONS = ('float32', 'dynamic', 'int8', 'float16')
+
+
+def calibration_images(annotation_path, size, num_images=100, seed=0):
+    """
+    Letterboxed images listed in an annotation file, as used by train.py
+    Args:
+        annotation_path (str): lines of `image_path box1 box2 ...`
+        size (tuple): (height, width) of the model input
+        num_images (int): images sampled from the file
+
+    Returns:
+        generator: float32 arrays of shape (1, height, width, 3)
+    """
+    from PIL import Image
+    from .yolo3.utils import letterbox_array
+    with open(annotation_path) as f:
+        paths = [line.split()[0] for line in f if line.strip()]
+    rng = np.random.RandomState(seed)
+    rng.shuffle(paths)
+    for path in paths[:num_images]:
+        image = np.asarray(Image.open(path).convert('RGB'))
+        yield letterbox_array(image, (size[1], size[0]))[np.newaxis]
+
+
+def export_tflite(yolo, output_path, quantization='float32', annotation_path=None, num_calibration=100):
+    """
+    Convert a detector's model body to TFLite at its model_image_size
+    Args:
+        yolo (YOLO): detector with a fixed model_image_size
+        output_path (str): .tflite file to write; metadata is written next to it as .json
+        quantization (str): one of QUANTIZATIONS
+        annotation_path (str): annotation file the int8 calibration images are drawn from
+        num_calibration (int): calibration images
+
+    Returns:
+        str: path of the metadata file
+    """
+    import tensorflow as tf
+    from keras import backend as K
+    from keras.layers import Input
+    from .yolo3.model import yolo_body, tiny_yolo_body
+
+    assert quantization in QUANTIZATIONS, 'Unknown quantization {}'.format(quantization)
+    assert yolo.model_image_size != (None, None), 'TFLite export requires a fixed model_image_size'
+    assert quantization != 'int8' or annotation_path, 'int8 quantization requires an annotation file'
+    height, width = yolo.model_image_size
+    num_anchors, num_classes = len(yolo.anchors), len(yolo.class_names)
+    weights = yolo.yolo_model.get_weights()
+
+    # The body is rebuilt with a static input shape, in a graph of its own.
+    previous_session = K.get_session()
+    graph = tf.Graph()
+    with graph.as_default():
+        sess = tf.Session(graph=graph)
+        K.set_session(sess)
+        try:
+            K.set_learning_phase(0)
+            inputs = Input(batch_shape=(1, height, width, 3))
+            fused = yolo.fold_batchnorm
+            model = tiny_yolo_body(inputs, num_anchors // 2, num_classes, fused) if num_anchors == 6 \
+                else yolo_body(inputs, num_anchors // 3, num_classes, fused)
+            model.set_weights(weights)
+            converter = tf.lite.TFLiteConverter.from_session(sess, [model.input], model.output)
+            if quantization != 'float32':
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if quantization == 'int8':
+                converter.representative_dataset = tf.lite.RepresentativeDataset(
+                    lambda: ([image] for image in calibration_images(annotation_path, (height, width),
+                                                                     num_calibration)))
+            elif quantization == 'float16':
+                converter.target_spec.supported_types = [tf.lite.constants.FLOAT16]
+            tflite_model = converter.convert()
+        finally:
+            sess.close()
+            K.set_session(previous_session)
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+
+    metadata = {
+        'config': {
+            'score': yolo.score,
+            'iou': yolo.iou,
+            'model_image_size': yolo.model_image_size,
+            'quantization': quantization,
+        },
+        'class_names': yolo.class_names,
+        'anchors': yolo.anchors.tolist(),
+    }
+    metadata_path = os.path.splitext(output_path)[0] + '.json'
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_path
+
+
+class TFLiteSession(object):
+    """
+    tf.lite.Interpreter behind the `sess.run(fetches, feed_dict)` interface `YOLO._run` uses
+    Args:
+        model_path (str): .tflite file
+        num_threads (int): (optional) interpreter threads
+
+    The input is fetched as `input` and the heads as `heads`, ordered from the coarsest grid
+    like `yolo_body` outputs. Batches are run one image at a time.
+    """
+
+    input = 'input'
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        if num_threads is not None:
+            self.interpreter.set_num_threads(num_threads)
+        self.interpreter.allocate_tensors()
+        self._input_index = self.interpreter.get_input_details()[0]['index']
+        outputs = self.interpreter.get_output_details()
+        self.heads = [detail['index'] for detail in sorted(outputs, key=lambda detail: detail['shape'][1])]
+
+    def run(self, fetches, feed_dict):
+        image_data = feed_dict[self.input]
+        results = [[] for _ in fetches]
+        for image in image_data:
+            self.interpreter.set_tensor(self._input_index, image[np.newaxis])
+            self.interpreter.invoke()
+            for result, index in zip(results, fetches):
+                result.append(self.interpreter.get_tensor(index))
+        return [np.concatenate(result) for result in results]
+
+    def close(self):
+        self.interpreter = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the YOLOv3 body to TFLite.')
+    parser.add_argument('output_path', help='Path to output .tflite file.')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, default='float32')
+    parser.add_argument('--annotations', help='Annotation file the int8 calibration images are drawn from')
+    parser.add_argument('--num_calibration', type=int, default=100)
+    parser.add_argument('--score', type=float, default=0.3)
+    parser.add_argument('--iou', type=float, default=0.45)
+    args = parser.parse_args()
+
+    from .yolo import YOLO
+    yolo = YOLO(score=args.score, iou=args.iou, postprocess='numpy')
+    metadata_path = export_tflite(yolo, args.output_path, args.quantization, args.annotations, args.num_calibration)
+    print('TFLite model written to {} ({})'.format(args.output_path, metadata_path))
+
+
+if __name__ == '__main__':
+    main()
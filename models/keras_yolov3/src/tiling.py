@@ -0,0 +1,96 @@
+"""
+Tiled detection for images much larger than the model input
+
+The image is cut into overlapping tiles of the model input size, which are
+run as one batch without any downscaling, so small objects keep their pixels.
+Boxes are shifted back to image coordinates and duplicates found on both
+sides of a tile border are merged with a class-aware NMS.
+"""
+
+import numpy as np
+from PIL import Image
+
+from .detection import DetectionBatch
+from .yolo3.postprocess import non_max_suppression
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of tiles of size `tile` covering `length`, consecutive tiles sharing `overlap` pixels"""
+    if length <= tile:
+        return [0]
+    assert overlap < tile, 'Overlap must be smaller than the tile'
+    return list(range(0, length - tile, tile - overlap)) + [length - tile]
+
+
+def merge_detections(boxes, scores, class_ids, iou_threshold):
+    """
+    Class-aware NMS over boxes gathered from several tiles
+    Args:
+        boxes (np.array): (n, 4) boxes x1, y1, x2, y2 in image coordinates
+
+    Returns:
+        np.array: indices of the boxes to keep, by decreasing score
+    """
+    if not len(scores):
+        return np.zeros(0, dtype=int)
+    # Offsetting every class by more than the image size keeps NMS from crossing classes.
+    span = boxes.max() + 1.
+    offset = boxes.astype('float32') + class_ids[:, None].astype('float32') * span
+    return np.array(non_max_suppression(offset, scores, iou_threshold), dtype=int)
+
+
+def detect_tiled_columnar(yolo, image, tile_size=None, overlap=64, full_image=True, batch_size=None,
+                          merge_iou=.5, classes=None):
+    """
+    Detect on overlapping tiles and merge the results
+    Args:
+        yolo (YOLO): detector
+        image (np.array or PIL.Image): image to run detections, arrays in the detector's `channel_order`
+        tile_size (int): tile side, a multiple of 32 (default: the detector's model_image_size, or 416)
+        overlap (int): pixels shared by neighbouring tiles; objects smaller than this are never cut
+        full_image (bool): also detect on the whole image letterboxed to one tile, for objects larger than a tile
+        batch_size (int): tiles per session run (default: all tiles in one run)
+        merge_iou (float): IoU above which boxes of the same class from different tiles are merged
+        classes (list): (optional) names or ids of the classes to detect, instead of the detector's `class_filter`
+
+    Returns:
+        DetectionBatch: detections in image coordinates
+    """
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert('RGB'))
+        if yolo.channel_order == 'bgr':
+            image = image[..., ::-1]
+    if tile_size is None:
+        tile_size = yolo.model_image_size[0] if yolo.model_image_size != (None, None) else 416
+    assert tile_size % 32 == 0, 'Multiples of 32 required'
+    height, width = image.shape[:2]
+    tile_height, tile_width = min(tile_size, height), min(tile_size, width)
+    origins = [(y, x) for y in tile_origins(height, tile_size, overlap)
+               for x in tile_origins(width, tile_size, overlap)]
+    images = [image[y:y + tile_height, x:x + tile_width] for y, x in origins]
+    if full_image and len(origins) > 1:
+        # The whole image letterboxed to the tile size rides in the same batch.
+        images.append(image)
+        origins.append((0, 0))
+
+    batch_size = batch_size or len(images)
+    class_mask = yolo._class_mask(classes)
+    batches = []
+    model_image_size = yolo.model_image_size
+    # Every input, the letterboxed full image included, is fed at the tile shape, whatever the
+    # detector's own model_image_size: tiles are never scaled down.
+    yolo.model_image_size = (max(tile_height - tile_height % 32, 32), max(tile_width - tile_width % 32, 32))
+    try:
+        for i in range(0, len(images), batch_size):
+            image_data, image_shapes = yolo._preprocess(images[i:i + batch_size])
+            batches.extend(yolo._to_detection_batches(yolo._run(image_data, image_shapes, class_mask), image_shapes))
+    finally:
+        yolo.model_image_size = model_image_size
+
+    offsets = np.concatenate([np.tile([x, y, x, y], (len(batch), 1))
+                              for (y, x), batch in zip(origins, batches)]).astype('int32')
+    boxes = np.concatenate([batch.boxes for batch in batches]) + offsets
+    scores = np.concatenate([batch.scores for batch in batches])
+    class_ids = np.concatenate([batch.class_ids for batch in batches])
+    keep = merge_detections(boxes, scores, class_ids, merge_iou)
+    return DetectionBatch(boxes[keep], scores[keep], class_ids[keep], yolo.class_names, yolo.colors)
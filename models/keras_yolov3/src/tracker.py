@@ -0,0 +1,241 @@
+"""
+Multi-object tracking between keyframes
+
+`KeyframeDetector` runs the full detector on every `interval`-th frame, or
+earlier when the tracks have gone stale, and moves the boxes with a constant
+velocity Kalman filter on the frames in between. All tracks are filtered
+together as (n, 8) state and (n, 8, 8) covariance arrays, and detections are
+associated to tracks by IoU with a greedy matcher.
+"""
+
+import numpy as np
+
+from .detection import DetectionBatch
+
+# Constant velocity model on (cx, cy, w, h) and their velocities.
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union
+    Args:
+        boxes_a (np.array): (n, 4) boxes x1, y1, x2, y2
+        boxes_b (np.array): (m, 4) boxes x1, y1, x2, y2
+
+    Returns:
+        np.array: (n, m) IoU of every pair
+    """
+    boxes_a = np.asarray(boxes_a, dtype='float32').reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype='float32').reshape(1, -1, 4)
+    mins = np.maximum(boxes_a[..., :2], boxes_b[..., :2])
+    maxes = np.minimum(boxes_a[..., 2:], boxes_b[..., 2:])
+    intersection = np.prod(np.maximum(maxes - mins, 0), axis=-1)
+    area_a = np.prod(boxes_a[..., 2:] - boxes_a[..., :2], axis=-1)
+    area_b = np.prod(boxes_b[..., 2:] - boxes_b[..., :2], axis=-1)
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-6)
+
+
+def greedy_match(iou, threshold):
+    """
+    Pair rows and columns by decreasing IoU, each used at most once
+    Returns:
+        tuple: matched row indices and column indices
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order], cols[order]):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matched_rows.append(r)
+        matched_cols.append(c)
+    return np.array(matched_rows, dtype=int), np.array(matched_cols, dtype=int)
+
+
+def _to_xyxy(state):
+    cx, cy, w, h = state[:, 0], state[:, 1], state[:, 2], state[:, 3]
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+def _to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype='float64').reshape(-1, 4)
+    return np.concatenate([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]], axis=1)
+
+
+class Tracker(object):
+    """
+    Vectorized IoU / Kalman tracker assigning stable ids to detections
+    Args:
+        iou_threshold (float): minimum IoU between a detection and a predicted track box to match them
+        max_age (int): keyframes a track may go unmatched before it is dropped
+        confidence_decay (float): factor applied to a track's confidence on every predicted frame
+    """
+
+    def __init__(self, iou_threshold=.3, max_age=2, confidence_decay=.9):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.confidence_decay = confidence_decay
+        self.mean = np.zeros((0, 8))
+        self.covariance = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=int)
+        self.class_ids = np.zeros(0, dtype=np.int16)
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.confidence = np.zeros(0)
+        self.misses = np.zeros(0, dtype=int)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _noise(self, heights, position, velocity):
+        """Diagonal noise scaled by the box height, one (8, 8) matrix per track"""
+        # Boxes clipped to the image can be 0 pixels high; their noise must not vanish.
+        heights = np.maximum(heights, 1.)
+        std = np.concatenate([np.repeat(position * heights[:, None], 4, axis=1),
+                              np.repeat(velocity * heights[:, None], 4, axis=1)], axis=1)
+        return std[:, :, None] ** 2 * np.eye(8)
+
+    def predict(self):
+        """Advance every track by one frame"""
+        if not len(self):
+            return
+        self.mean = self.mean @ _F.T
+        self.covariance = _F @ self.covariance @ _F.T + self._noise(self.mean[:, 3], 1. / 20, 1. / 160)
+        self.confidence *= self.confidence_decay
+
+    def update(self, batch):
+        """
+        Correct the predicted tracks with the detections of a keyframe, start tracks for unmatched
+        detections and drop tracks unmatched for more than `max_age` keyframes
+        Args:
+            batch (DetectionBatch): detections of the keyframe
+
+        Returns:
+            np.array: track id of every detection of `batch`
+        """
+        measurements = _to_cxcywh(batch.boxes)
+        iou = iou_matrix(batch.boxes, _to_xyxy(self.mean))
+        iou[batch.class_ids[:, None] != self.class_ids[None, :]] = 0
+        det_idx, track_idx = greedy_match(iou, self.iou_threshold)
+
+        if len(track_idx):
+            mean, covariance = self.mean[track_idx], self.covariance[track_idx]
+            innovation_cov = _H @ covariance @ _H.T + self._noise(mean[:, 3], 1. / 20, 0)[:, :4, :4]
+            # gain = P H' S^-1, solved as S gain' = H P since S and P are symmetric.
+            gain = np.linalg.solve(innovation_cov, _H @ covariance).transpose(0, 2, 1)
+            innovation = measurements[det_idx] - mean[:, :4]
+            self.mean[track_idx] = mean + np.einsum('nij,nj->ni', gain, innovation)
+            self.covariance[track_idx] = covariance - gain @ _H @ covariance
+            self.scores[track_idx] = batch.scores[det_idx]
+            self.confidence[track_idx] = batch.scores[det_idx]
+        self.misses += 1
+        self.misses[track_idx] = 0
+
+        track_ids = np.empty(len(batch), dtype=int)
+        track_ids[det_idx] = self.ids[track_idx]
+        new = np.setdiff1d(np.arange(len(batch)), det_idx)
+        if len(new):
+            new_ids = np.arange(self._next_id, self._next_id + len(new))
+            self._next_id += len(new)
+            track_ids[new] = new_ids
+            mean = np.concatenate([measurements[new], np.zeros((len(new), 4))], axis=1)
+            covariance = self._noise(mean[:, 3], 2. / 20, 10. / 160)
+            self.mean = np.concatenate([self.mean, mean])
+            self.covariance = np.concatenate([self.covariance, covariance])
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.class_ids = np.concatenate([self.class_ids, batch.class_ids[new]])
+            self.scores = np.concatenate([self.scores, batch.scores[new]])
+            self.confidence = np.concatenate([self.confidence, batch.scores[new].astype('float64')])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=int)])
+
+        keep = self.misses <= self.max_age
+        for name in ('mean', 'covariance', 'ids', 'class_ids', 'scores', 'confidence', 'misses'):
+            setattr(self, name, getattr(self, name)[keep])
+        return track_ids
+
+    def min_confidence(self):
+        """Lowest confidence of the tracks matched on the last keyframe, 1 when there are none"""
+        live = self.misses == 0
+        return float(self.confidence[live].min()) if live.any() else 1.
+
+    def detections(self, image_shape, class_names, colors=None):
+        """
+        Current box of every track matched on the last keyframe
+        Args:
+            image_shape (tuple): (height, width) to clip the boxes to
+
+        Returns:
+            tuple: DetectionBatch of the boxes and the track id of every box
+        """
+        live = self.misses == 0
+        boxes = np.floor(_to_xyxy(self.mean[live]) + .5)
+        boxes[:, :2] = np.maximum(boxes[:, :2], 0)
+        boxes[:, 2:] = np.minimum(boxes[:, 2:], [image_shape[1], image_shape[0]])
+        return DetectionBatch(boxes, self.scores[live], self.class_ids[live], class_names, colors), self.ids[live]
+
+
+class KeyframeDetector(object):
+    """
+    Runs `yolo` on keyframes only and tracks the boxes in between
+    Args:
+        yolo (YOLO): detector
+        interval (int): frames between two keyframes; 1 detects on every frame
+        min_confidence (float): force a keyframe when a track's decayed confidence falls below this
+        tracker (Tracker): (optional) tracker to use instead of a default one
+    """
+
+    def __init__(self, yolo, interval=5, min_confidence=.2, tracker=None):
+        assert interval >= 1, 'interval must be at least 1'
+        self.yolo = yolo
+        self.interval = interval
+        self.min_confidence = min_confidence
+        self.tracker = tracker or Tracker()
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.track_ids = np.zeros(0, dtype=int)
+        self._since_keyframe = None
+
+    def needs_detection(self):
+        """Whether the next frame must be a keyframe"""
+        return self._since_keyframe is None or self._since_keyframe + 1 >= self.interval or \
+            self.tracker.min_confidence() < self.min_confidence
+
+    def update(self, image_shape, detect):
+        """
+        Detections of the next frame
+        Args:
+            image_shape (tuple): (height, width) of the frame
+            detect (callable): returns the frame's `DetectionBatch`, only called on keyframes
+
+        Returns:
+            DetectionBatch: detected or tracked boxes; their track ids are in `track_ids`
+        """
+        keyframe = self.needs_detection()
+        self.tracker.predict()
+        if keyframe:
+            batch = detect()
+            self.track_ids = self.tracker.update(batch)
+            self._since_keyframe = 0
+            self.keyframes += 1
+            self.yolo.metrics.inc('keyframes')
+            return batch
+        batch, self.track_ids = self.tracker.detections(image_shape, self.yolo.class_names, self.yolo.colors)
+        self._since_keyframe += 1
+        self.tracked_frames += 1
+        self.yolo.metrics.inc('tracked_frames')
+        return batch
+
+    def detect_columnar(self, image):
+        """Same as `YOLO.detect_columnar`, for consecutive frames of one video"""
+        image_shape = (image.height, image.width) if hasattr(image, 'height') else image.shape[:2]
+        return self.update(image_shape, lambda: self.yolo.detect_columnar(image))
+
+    def detect(self, image):
+        """Same as `YOLO.detect`, for consecutive frames of one video"""
+        return self.detect_columnar(image).to_detections()
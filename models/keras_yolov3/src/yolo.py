@@ -4,29 +4,22 @@ Class definition of YOLO_v3 style detection model on image and video
 """
 
 import colorsys
+import json
 import os
 from timeit import default_timer as timer
 
 import numpy as np
+import tensorflow as tf
 from keras import backend as K
 from keras.models import load_model
 from keras.layers import Input
-from PIL import Image, ImageFont, ImageDraw
-import cv2
+from PIL import Image
 
-from .yolo3.model import yolo_eval, yolo_body, tiny_yolo_body
-from .yolo3.utils import letterbox_image
-from keras.utils import multi_gpu_model
-import google_drive_downloader
-
-
-class Detection(object):
-    def __init__(self, bbox, label, color, score):
-        self.bbox = [int(i) for i in bbox]
-        self.x1, self.y1, self.x2, self.y2 = self.bbox
-        self.label = label
-        self.color = color
-        self.score = score
+from .yolo3.model import yolo_eval, yolo_body, tiny_yolo_body, fold_batch_norms, cast_body
+from .yolo3.utils import letterbox_array
+from .yolo3.postprocess import yolo_eval_numpy
+from .detection import Detection, DetectionBatch
+from .metrics import Metrics
 
 
 class YOLO(object):
@@ -36,8 +29,26 @@ class YOLO(object):
         "classes_path": 'model_data/coco_classes.txt',
         "score": 0.3,
         "iou": 0.45,
+        "max_boxes": 20,
+        "class_filter": None,
         "model_image_size": (416, 416),
         "gpu_num": 1,
+        "interpolation": 'cubic',
+        "channel_order": 'rgb',
+        "nms_mode": 'per_class',
+        "pre_nms_top_k": 1000,
+        "postprocess": 'graph',
+        "render": True,
+        "latency_budget": None,
+        "resolution_ladder": (320, 416, 512, 608),
+        "fold_batchnorm": False,
+        "precision": 'float32',
+        "cache_size": 0,
+        "cache_dir": None,
+        "warmup_on_init": False,
+        "warmup_shapes": None,
+        "warmup_batch_sizes": (1,),
+        "registry": None,
     }
 
     @classmethod
@@ -59,13 +70,16 @@ class YOLO(object):
         self.class_names = self._get_class()
         self.anchors = self._get_anchors()
         self.sess = K.get_session()
+        self._input_buffer = None
+        self.metrics = Metrics()
 
-        self.boxes, self.scores, self.classes = self.generate()
+        self.boxes, self.scores, self.classes, self.batch_index = self.generate()
+        self._setup_runtime(self.model_path)
 
     def _maybe_download_weights(self):
-        gdd = google_drive_downloader.GoogleDriveDownloader()
-
         if not os.path.exists(self.model_path):
+            import google_drive_downloader
+            gdd = google_drive_downloader.GoogleDriveDownloader()
             print('weights file not found. Downloading...')
             gdd.download_file_from_google_drive(file_id=self.weights_file_id, dest_path=self.model_path,
                                                 overwrite=True)
@@ -86,234 +100,602 @@ class YOLO(object):
         return np.array(anchors).reshape(-1, 2)
 
     def generate(self):
-        model_path = os.path.expanduser(self.model_path)
-        assert model_path.endswith('.h5'), 'Keras model or weights must be a .h5 file.'
-
-        # Load model, or construct model and load weights.
+        assert self.precision in ('float32', 'float16'), 'Unknown precision {}'.format(self.precision)
+        assert self.postprocess in ('graph', 'numpy'), 'Unknown postprocess {}'.format(self.postprocess)
+        self.colors = self._generate_colors()
+        if self.registry is not None:
+            if self.registry is True:
+                from .registry import default_registry
+                self.registry = default_registry()
+            self._registry_key = (os.path.abspath(os.path.expanduser(self.model_path)),
+                                  tuple(map(tuple, self.anchors.tolist())), tuple(self.class_names),
+                                  self.fold_batchnorm, self.precision, self.gpu_num, self.postprocess,
+                                  self.nms_mode, self.pre_nms_top_k)
+            model = self.registry.acquire(self._registry_key, self._build_model)
+        else:
+            model = self._build_model()
+        for name in ('yolo_model', 'input_tensor', 'output_tensors', 'input_image_shape',
+                     'score_input', 'iou_input', 'max_boxes_input', 'class_mask_input'):
+            setattr(self, name, model[name])
+        self._extra_feeds = {K.learning_phase(): 0}
+        return model['outputs']
+
+    def _load_model(self, model_path):
+        """Load the Keras model, or construct the body and load its weights"""
         num_anchors = len(self.anchors)
         num_classes = len(self.class_names)
         is_tiny_version = num_anchors == 6  # default setting
         try:
-            self.yolo_model = load_model(model_path, compile=False)
+            yolo_model = load_model(model_path, compile=False)
         except:
-            self.yolo_model = tiny_yolo_body(Input(shape=(None, None, 3)), num_anchors // 2, num_classes) \
+            yolo_model = tiny_yolo_body(Input(shape=(None, None, 3)), num_anchors // 2, num_classes) \
                 if is_tiny_version else yolo_body(Input(shape=(None, None, 3)), num_anchors // 3, num_classes)
-            self.yolo_model.load_weights(self.model_path)  # make sure model, anchors and classes match
+            yolo_model.load_weights(model_path)  # make sure model, anchors and classes match
         else:
-            assert self.yolo_model.layers[-1].output_shape[-1] == \
-                   num_anchors / len(self.yolo_model.output) * (num_classes + 5), \
+            assert yolo_model.layers[-1].output_shape[-1] == \
+                   num_anchors / len(yolo_model.output) * (num_classes + 5), \
                 'Mismatch between model and given anchor and class sizes'
+        return yolo_model
+
+    def _build_model(self):
+        """
+        Load the Keras model and build the post-processing graph, the part detectors can share
+        Returns:
+            dict: model, input and output tensors, threshold inputs, and the boxes, scores, classes
+                and batch index tensors (None with postprocess='numpy')
+        """
+        model_path = os.path.expanduser(self.model_path)
+        assert model_path.endswith('.h5'), 'Keras model or weights must be a .h5 file.'
+
+        num_anchors = len(self.anchors)
+        num_classes = len(self.class_names)
+        if not self.fold_batchnorm and self.precision == 'float32':
+            yolo_model = self._load_model(model_path)
+        else:
+            # Loaded and folded in a scratch graph, so that only the final weights end up in the session.
+            graph = tf.Graph()
+            with graph.as_default():
+                sess = tf.Session(graph=graph)
+                K.set_session(sess)
+                try:
+                    loaded = self._load_model(model_path)
+                    if self.fold_batchnorm:
+                        # Conv + bias + LeakyReLU only.
+                        loaded = fold_batch_norms(loaded, num_anchors // len(loaded.output), num_classes)
+                    weights = loaded.get_weights()
+                finally:
+                    sess.close()
+                    K.set_session(self.sess)
+            yolo_model = cast_body(loaded, num_anchors // len(loaded.output), num_classes, self.precision,
+                                   weights=weights)
 
         print('{} model, anchors, and classes loaded.'.format(model_path))
 
-        # Generate colors for drawing bounding boxes.
+        # Generate output tensor targets for filtered bounding boxes.
+        # One (height, width) row per image in the batch.
+        input_image_shape = K.placeholder(shape=(None, 2))
+        # Thresholds and the class filter are inputs, so that detectors sharing this graph can each
+        # feed their own. All are float32, the type frozen exports turn their inputs into.
+        score_input = tf.placeholder_with_default(np.float32(self.score), shape=(), name='score_threshold')
+        iou_input = tf.placeholder_with_default(np.float32(self.iou), shape=(), name='iou_threshold')
+        max_boxes_input = tf.placeholder_with_default(np.float32(self.max_boxes), shape=(), name='max_boxes')
+        class_mask_input = tf.placeholder_with_default(np.ones(len(self.class_names), dtype='float32'),
+                                                       shape=(len(self.class_names),), name='class_mask')
+        if self.gpu_num >= 2:
+            from keras.utils import multi_gpu_model
+            yolo_model = multi_gpu_model(yolo_model, gpus=self.gpu_num)
+        # Box decoding and NMS always run in float32.
+        output_tensors = [K.cast(output, 'float32') if K.dtype(output) != 'float32' else output
+                          for output in yolo_model.output]
+        outputs = None, None, None, None
+        if self.postprocess == 'graph':
+            outputs = yolo_eval(output_tensors, self.anchors, len(self.class_names), input_image_shape,
+                                max_boxes=max_boxes_input, score_threshold=score_input,
+                                iou_threshold=iou_input, nms_mode=self.nms_mode,
+                                pre_nms_top_k=self.pre_nms_top_k, class_mask=class_mask_input)
+        # else boxes are decoded on the host from the raw head outputs, see `_run`.
+        return {
+            'yolo_model': yolo_model,
+            'input_tensor': yolo_model.input,
+            'output_tensors': output_tensors,
+            'input_image_shape': input_image_shape,
+            'score_input': score_input,
+            'iou_input': iou_input,
+            'max_boxes_input': max_boxes_input,
+            'class_mask_input': class_mask_input,
+            'outputs': outputs,
+        }
+
+    def _generate_colors(self):
+        """Generate colors for drawing bounding boxes."""
         hsv_tuples = [(x / len(self.class_names), 1., 1.)
                       for x in range(len(self.class_names))]
-        self.colors = list(map(lambda x: colorsys.hsv_to_rgb(*x), hsv_tuples))
-        self.colors = list(
+        colors = list(map(lambda x: colorsys.hsv_to_rgb(*x), hsv_tuples))
+        colors = list(
             map(lambda x: (int(x[0] * 255), int(x[1] * 255), int(x[2] * 255)),
-                self.colors))
+                colors))
         np.random.seed(10101)  # Fixed seed for consistent colors across runs.
-        np.random.shuffle(self.colors)  # Shuffle colors to decorrelate adjacent classes.
+        np.random.shuffle(colors)  # Shuffle colors to decorrelate adjacent classes.
         np.random.seed(None)  # Reset seed to default.
+        return colors
 
-        # Generate output tensor targets for filtered bounding boxes.
-        self.input_image_shape = K.placeholder(shape=(2,))
-        if self.gpu_num >= 2:
-            self.yolo_model = multi_gpu_model(self.yolo_model, gpus=self.gpu_num)
-        boxes, scores, classes = yolo_eval(self.yolo_model.output, self.anchors,
-                                           len(self.class_names), self.input_image_shape,
-                                           score_threshold=self.score, iou_threshold=self.iou)
-        return boxes, scores, classes
+    @classmethod
+    def _from_metadata(cls, path, kwargs):
+        """Detector configured from the .json written next to an exported model, without a model yet"""
+        with open(os.path.splitext(path)[0] + '.json') as f:
+            metadata = json.load(f)
+        self = cls.__new__(cls)
+        self.__dict__.update(cls._defaults)
+        self.__dict__.update(metadata['config'])
+        self.__dict__.update(kwargs)
+        assert self.registry is None, 'Exported models run on a session of their own'
+        self.model_image_size = tuple(self.model_image_size)
+        self.class_names = metadata['class_names']
+        self.anchors = np.array(metadata['anchors'])
+        self.colors = self._generate_colors()
+        self._input_buffer = None
+        self.metrics = Metrics()
+        return self, metadata
 
-    def detect_image(self, image):
-        start = timer()
+    @classmethod
+    def from_tflite(cls, path, num_threads=None, **kwargs):
+        """
+        Load a detector running a model written by `tflite.export_tflite` in the TFLite interpreter
+        Args:
+            path (str): .tflite file; its metadata is read from the .json next to it
+            num_threads (int): (optional) interpreter threads
+            **kwargs: overrides of the exported configuration
 
+        Returns:
+            YOLO: detector with NumPy post-processing, at the exported model_image_size
+        """
+        from .tflite import TFLiteSession
+        self, _ = cls._from_metadata(path, kwargs)
+        assert self.latency_budget is None, 'TFLite models have a fixed input size'
+        self.postprocess = 'numpy'
+        self.precision = 'float32'  # the interpreter is always fed float32
+        self.sess = TFLiteSession(path, num_threads)
+        self.input_tensor = TFLiteSession.input
+        self.input_image_shape = None
+        self.output_tensors = self.sess.heads
+        self.boxes = self.scores = self.classes = self.batch_index = None
+        self.score_input = self.iou_input = self.max_boxes_input = self.class_mask_input = None
+        self._extra_feeds = {}
+        self._setup_runtime(path)
+        return self
+
+    @classmethod
+    def from_frozen(cls, path, **kwargs):
+        """
+        Load a detector from a graph written by `export.export_frozen`, without building the Keras model
+        Args:
+            path (str): frozen GraphDef (.pb); its metadata is read from the .json next to it
+            **kwargs: overrides of the exported configuration. nms_mode is baked into the graph and
+                only takes effect with postprocess='numpy'; so are score, iou and max_boxes in graphs
+                exported without threshold inputs
+
+        Returns:
+            YOLO: detector running on its own graph and session
+        """
+        self, metadata = cls._from_metadata(path, kwargs)
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.sess = tf.Session(graph=graph)
+        tensors = metadata['tensors']
+        self.input_tensor = graph.get_tensor_by_name(tensors['input'])
+        self.input_image_shape = graph.get_tensor_by_name(tensors['image_shape'])
+        self.output_tensors = [graph.get_tensor_by_name(name) for name in tensors['heads']]
+        self.boxes, self.scores, self.classes, self.batch_index = [
+            graph.get_tensor_by_name(tensors[name]) for name in ('boxes', 'scores', 'classes', 'batch_index')]
+        self.score_input = self.iou_input = self.max_boxes_input = self.class_mask_input = None
+        if 'score' in tensors:
+            self.score_input = graph.get_tensor_by_name(tensors['score'])
+            self.iou_input = graph.get_tensor_by_name(tensors['iou'])
+        if 'max_boxes' in tensors:
+            self.max_boxes_input = graph.get_tensor_by_name(tensors['max_boxes'])
+            self.class_mask_input = graph.get_tensor_by_name(tensors['class_mask'])
+        self._extra_feeds = {}
+        self._setup_runtime(path)
+        return self
+
+    def _setup_runtime(self, weights_path):
+        """Options that need a ready session: the result cache, adaptive resolution and warmup"""
+        self.ready = False
+        self._first_request = True
+        self.result_cache = None
+        if self.cache_size or self.cache_dir:
+            from .cache import ResultCache, file_fingerprint
+            self.result_cache = ResultCache(self.cache_size or 64 * 1024 * 1024, self.cache_dir,
+                                            metrics=self.metrics)
+            self._weights_fingerprint = file_fingerprint(weights_path)
+        self.resolution_controller = None
+        if self.latency_budget is not None:
+            self._enable_adaptive_resolution()
+        if self.warmup_on_init:
+            self.warmup(self.warmup_shapes, self.warmup_batch_sizes)
+        self.ready = True
+
+    def warmup(self, shapes=None, batch_sizes=(1,)):
+        """
+        Run dummy inputs through the full detection fetch, so that TensorFlow allocates buffers and
+        picks kernels before the first real request instead of during it
+        Args:
+            shapes (list): model input (height, width) pairs (default: model_image_size, or 416x416)
+            batch_sizes (list): batch sizes to run every shape at
+
+        Returns:
+            float: seconds spent, also recorded as the 'warmup' stage in `metrics`
+        """
+        if shapes is None:
+            shapes = [self.model_image_size if self.model_image_size != (None, None) else (416, 416)]
+        start = timer()
+        metrics, self.metrics = self.metrics, Metrics()  # keep dummy runs out of the latency histograms
+        try:
+            for height, width in shapes:
+                for batch_size in batch_sizes:
+                    self._run(np.zeros((batch_size, height, width, 3), dtype=self.precision),
+                              [[height, width]] * batch_size)
+        finally:
+            self.metrics = metrics
+        elapsed = timer() - start
+        self.metrics.observe('warmup', elapsed)
+        return elapsed
+
+    def _enable_adaptive_resolution(self):
+        """
+        Let `latency_budget` (seconds per image) drive `model_image_size` along `resolution_ladder`.
+        Every rung is run once up front so that switching does not stall on a new input shape.
+        """
+        from .adaptive import ResolutionController
+        initial = self.model_image_size[0] if self.model_image_size != (None, None) else None
+        self.resolution_controller = ResolutionController(self.resolution_ladder, self.latency_budget,
+                                                          initial=initial)
+        self.warmup([(size, size) for size in self.resolution_controller.ladder])
+        self.model_image_size = self.resolution_controller.size
+
+    def _adapt_resolution(self, latency):
+        """Feed the latency of one image to the resolution controller, when adaptive"""
+        if self.resolution_controller is not None and self.resolution_controller.update(latency):
+            self.model_image_size = self.resolution_controller.size
+            self.metrics.inc('resolution_switches')
+
+    def _input_size(self, image):
+        """(width, height) the model is fed for an image of shape (height, width, 3)"""
         if self.model_image_size != (None, None):
             assert self.model_image_size[0] % 32 == 0, 'Multiples of 32 required'
             assert self.model_image_size[1] % 32 == 0, 'Multiples of 32 required'
-            boxed_image = letterbox_image(image, tuple(reversed(self.model_image_size)))
-        else:
-            new_image_size = (image.width - (image.width % 32),
-                              image.height - (image.height % 32))
-            boxed_image = letterbox_image(image, new_image_size)
-        image_data = np.array(boxed_image, dtype='float32')
-
-        print(image_data.shape)
-        image_data /= 255.
-        image_data = np.expand_dims(image_data, 0)  # Add batch dimension.
-
-        out_boxes, out_scores, out_classes = self.sess.run(
-            [self.boxes, self.scores, self.classes],
-            feed_dict={
-                self.yolo_model.input: image_data,
-                self.input_image_shape: [image.size[1], image.size[0]],
-                K.learning_phase(): 0
-            })
-
-        print('Found {} boxes for {}'.format(len(out_boxes), 'img'))
-
-        font = ImageFont.truetype(font='font/FiraMono-Medium.otf',
-                                  size=np.floor(3e-2 * image.size[1] + 0.5).astype('int32'))
-        thickness = (image.size[0] + image.size[1]) // 300
-
-        for i, c in reversed(list(enumerate(out_classes))):
-            predicted_class = self.class_names[c]
-            box = out_boxes[i]
-            score = out_scores[i]
-
-            label = '{} {:.2f}'.format(predicted_class, score)
-            draw = ImageDraw.Draw(image)
-            label_size = draw.textsize(label, font)
-
-            top, left, bottom, right = box
-            top = max(0, np.floor(top + 0.5).astype('int32'))
-            left = max(0, np.floor(left + 0.5).astype('int32'))
-            bottom = min(image.size[1], np.floor(bottom + 0.5).astype('int32'))
-            right = min(image.size[0], np.floor(right + 0.5).astype('int32'))
-            print(label, (left, top), (right, bottom))
-
-            if top - label_size[1] >= 0:
-                text_origin = np.array([left, top - label_size[1]])
+            return tuple(reversed(self.model_image_size))
+        height, width = image.shape[:2]
+        return width - (width % 32), height - (height % 32)
+
+    def _preprocess(self, images):
+        """
+        Letterbox images into the reusable model input buffer
+        Args:
+            images (list): list of np.array (uint8, `channel_order` channels) or PIL.Image images
+
+        Returns:
+            tuple: batch of shape (n, height, width, 3) in `precision`, scaled to [0, 1], and the
+                (height, width) of every original image
+        """
+        start = timer()
+        arrays = []
+        for image in images:
+            if isinstance(image, Image.Image):
+                arrays.append((np.asarray(image.convert('RGB')), False))
             else:
-                text_origin = np.array([left, top + 1])
-
-            # My kingdom for a good redistributable image drawing library.
-            for i in range(thickness):
-                draw.rectangle(
-                    [left + i, top + i, right - i, bottom - i],
-                    outline=self.colors[c])
-            draw.rectangle(
-                [tuple(text_origin), tuple(text_origin + label_size)],
-                fill=self.colors[c])
-            draw.text(text_origin, label, fill=(0, 0, 0), font=font)
-            del draw
-
-        end = timer()
-        print(end - start)
+                arrays.append((image, self.channel_order == 'bgr'))
+        width, height = self._input_size(arrays[0][0])
+        shape = (len(arrays), height, width, 3)
+        if self._input_buffer is None or self._input_buffer.shape != shape:
+            # float16 models are fed half-size buffers.
+            self._input_buffer = np.empty(shape, dtype=self.precision)
+        for i, (array, swap_rb) in enumerate(arrays):
+            letterbox_array(array, (width, height), out=self._input_buffer[i],
+                            interpolation=self.interpolation, swap_rb=swap_rb)
+        image_shapes = [list(array.shape[:2]) for array, _ in arrays]
+        self.metrics.observe('preprocess', timer() - start)
+        return self._input_buffer, image_shapes
+
+    def _class_mask(self, classes):
+        """
+        Mask of the classes to detect
+        Args:
+            classes (list): class names or ids, None for all classes
+
+        Returns:
+            np.array: bool per class id, None for all classes
+        """
+        if classes is None:
+            return None
+        mask = np.zeros(len(self.class_names), dtype=bool)
+        for c in classes:
+            mask[self.class_names.index(c) if isinstance(c, str) else c] = True
+        return mask
+
+    def _feed_dict(self, image_data, image_shapes=None, class_mask=None):
+        feed_dict = {self.input_tensor: image_data}
+        if image_shapes is not None:
+            feed_dict[self.input_image_shape] = image_shapes
+        if self.score_input is not None:
+            feed_dict[self.score_input] = self.score
+            feed_dict[self.iou_input] = self.iou
+        if self.max_boxes_input is not None:
+            feed_dict[self.max_boxes_input] = self.max_boxes
+            # Fed every run: frozen exports have no default to fall back on.
+            feed_dict[self.class_mask_input] = np.ones(len(self.class_names), dtype='float32') \
+                if class_mask is None else class_mask.astype('float32')
+        feed_dict.update(self._extra_feeds)
+        return feed_dict
+
+    def _run(self, image_data, image_shapes, class_mask=None):
+        """
+        Run the model and box post-processing on a preprocessed batch
+        Args:
+            image_data (np.array): batch from `_preprocess`
+            image_shapes (list): (height, width) of every original image
+            class_mask (np.array): (optional) classes to detect, see `_class_mask`;
+                by default those of `class_filter`
+
+        Returns:
+            tuple: boxes (y_min, x_min, y_max, x_max), scores, classes and batch index of every box
+        """
+        start = timer()
+        if class_mask is None:
+            class_mask = self._class_mask(self.class_filter)
+        if self.postprocess == 'numpy':
+            outputs = self.sess.run(self.output_tensors, feed_dict=self._feed_dict(image_data))
+            decode_start = timer()
+            self.metrics.observe('session_run', decode_start - start)
+            results = [yolo_eval_numpy([output[b] for output in outputs], self.anchors,
+                                       len(self.class_names), image_shape, max_boxes=self.max_boxes,
+                                       score_threshold=self.score, iou_threshold=self.iou,
+                                       class_mask=class_mask)
+                       for b, image_shape in enumerate(image_shapes)]
+            out_boxes, out_scores, out_classes = [np.concatenate(r) for r in zip(*results)]
+            out_batch_index = np.concatenate([np.full(len(r[0]), b, dtype='int32')
+                                              for b, r in enumerate(results)])
+            self.metrics.observe('decode', timer() - decode_start)
+            return out_boxes, out_scores, out_classes, out_batch_index
+        outputs = self.sess.run(
+            [self.boxes, self.scores, self.classes, self.batch_index],
+            feed_dict=self._feed_dict(image_data, image_shapes, class_mask))
+        self.metrics.observe('session_run', timer() - start)
+        if class_mask is not None and self.class_mask_input is None:
+            # Graph exported without a class filter input.
+            keep = class_mask[outputs[2]]
+            outputs = [output[keep] for output in outputs]
+        return outputs
+
+    def detect_image(self, image):
+        """
+        Run detection on image and draw the detections on it
+        Args:
+            image (PIL.Image or np.array): image to run detections, arrays in `channel_order`
+
+        Returns:
+            PIL.Image or np.array: annotated copy of the image, of the same type;
+                the input itself when `render` is False
+        """
+        image_data, image_shapes = self._preprocess([image])
+        detections = self._to_detection_batches(self._run(image_data, image_shapes), image_shapes)[0]
+
+        if self.render:
+            from .render import default_renderer
+            start = timer()
+            if isinstance(image, Image.Image):
+                img = np.array(image.convert('RGB'))
+                image = Image.fromarray(default_renderer().draw(img, detections, out=img))
+            else:
+                image = default_renderer().draw(image, detections)
+            self.metrics.observe('render', timer() - start)
         return image
 
-    def detect(self, image):
+    def detect(self, image, classes=None):
         """
         Run detection on image
         Args:
-            image (np.array or PIL.Image): image to run detections
+            image (np.array or PIL.Image): image to run detections, arrays in `channel_order`
+            classes (list): (optional) names or ids of the classes to detect, instead of `class_filter`
 
         Returns:
             list: list of `Detection` objects
         """
-        if isinstance(image, np.ndarray):
-            image = Image.fromarray(image)
-        if self.model_image_size != (None, None):
-            assert self.model_image_size[0] % 32 == 0, 'Multiples of 32 required'
-            assert self.model_image_size[1] % 32 == 0, 'Multiples of 32 required'
-            boxed_image = letterbox_image(image, tuple(reversed(self.model_image_size)))
+        return self.detect_batch([image], classes=classes)[0]
+
+    def detect_batch(self, images, cache_keys=None, classes=None):
+        """
+        Run detection on several images with a single session call
+        Args:
+            images (list): list of np.array or PIL.Image images, sizes may differ.
+                Arrays are read in `channel_order` ('rgb' or 'bgr')
+            cache_keys (list): (optional) result cache key of every image, e.g. `cache.bytes_key` of
+                the encoded image; by default the pixels are hashed when the cache is enabled
+            classes (list): (optional) names or ids of the classes to detect, instead of `class_filter`.
+                Boxes of other classes are dropped before NMS, which then runs for these classes only
+
+        Returns:
+            list: one list of `Detection` objects per input image
+        """
+        return [batch.to_detections() for batch in self.detect_batch_columnar(images, cache_keys, classes)]
+
+    def detect_columnar(self, image, classes=None):
+        """
+        Run detection on image, returning columns instead of per-box objects
+        Args:
+            image (np.array or PIL.Image): image to run detections, arrays in `channel_order`
+            classes (list): (optional) names or ids of the classes to detect, instead of `class_filter`
+
+        Returns:
+            DetectionBatch: boxes, scores and class ids of the detections
+        """
+        return self.detect_batch_columnar([image], classes=classes)[0]
+
+    def detect_batch_columnar(self, images, cache_keys=None, classes=None):
+        """
+        Same as `detect_batch`, returning one `DetectionBatch` per input image
+        """
+        if not images:
+            return []
+        start = timer()
+        class_mask = self._class_mask(self.class_filter if classes is None else classes)
+        if self.result_cache is not None:
+            batches = self._detect_cached(images, cache_keys, class_mask)
         else:
-            new_image_size = (image.width - (image.width % 32),
-                              image.height - (image.height % 32))
-            boxed_image = letterbox_image(image, new_image_size)
-        image_data = np.array(boxed_image, dtype='float32')
-        image_data /= 255.
-        image_data = np.expand_dims(image_data, 0)  # Add batch dimension.
-        out_boxes, out_scores, out_classes = self.sess.run(
-            [self.boxes, self.scores, self.classes],
-            feed_dict={
-                self.yolo_model.input: image_data,
-                self.input_image_shape: [image.size[1], image.size[0]],
-                K.learning_phase(): 0
-            })
-        detections = []
-        for i, c in reversed(list(enumerate(out_classes))):
-            top, left, bottom, right = out_boxes[i]
-            top = max(0, np.floor(top + 0.5).astype('int32'))
-            left = max(0, np.floor(left + 0.5).astype('int32'))
-            bottom = min(image.size[1], np.floor(bottom + 0.5).astype('int32'))
-            right = min(image.size[0], np.floor(right + 0.5).astype('int32'))
-            predicted_class = self.class_names[c]
-            bbox = [left, top, right, bottom]
-            score = out_scores[i]
-            detection = Detection(bbox=bbox,
-                                  label=predicted_class,
-                                  color=self.colors[c],
-                                  score=score)
-            detections.append(detection)
-
-        return detections
+            batches = self._detect_batch_columnar(images, class_mask)
+        if self._first_request:
+            self._first_request = False
+            self.metrics.observe('first_request', timer() - start)
+        return batches
+
+    def _detect_batch_columnar(self, images, class_mask=None):
+        if len(images) > 1:
+            assert self.model_image_size != (None, None), \
+                'Batched detection requires a fixed model_image_size'
+        start = timer()
+        image_data, image_shapes = self._preprocess(images)
+        batches = self._to_detection_batches(self._run(image_data, image_shapes, class_mask), image_shapes)
+        self._adapt_resolution((timer() - start) / len(images))
+        return batches
+
+    def _config_key(self, class_mask=None):
+        """Hash of the settings the detections depend on, part of every result cache key"""
+        from .cache import config_key
+        classes = None if class_mask is None else tuple(np.flatnonzero(class_mask).tolist())
+        return config_key(self.score, self.iou, self.max_boxes, classes, tuple(self.model_image_size),
+                          self.nms_mode, self.pre_nms_top_k, self.postprocess, self.channel_order,
+                          self.interpolation, self.fold_batchnorm, self.precision,
+                          self._weights_fingerprint)
+
+    def _detect_cached(self, images, cache_keys=None, class_mask=None):
+        """`detect_batch_columnar` through the result cache; only the misses are run, as one batch"""
+        from .cache import image_key
+        prefix = self._config_key(class_mask)
+        if cache_keys is None:
+            cache_keys = [image_key(image) for image in images]
+        keys = ['{}-{}'.format(prefix, key) for key in cache_keys]
+        results = [self.result_cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        batches = [None if result is None else DetectionBatch(*result, class_names=self.class_names,
+                                                              colors=self.colors)
+                   for result in results]
+        if misses:
+            computed = self._detect_batch_columnar([images[i] for i in misses], class_mask)
+            for i, batch in zip(misses, computed):
+                self.result_cache.put(keys[i], batch.boxes, batch.scores, batch.class_ids)
+                batches[i] = batch
+        return batches
+
+    def detect_tiled(self, image, **kwargs):
+        """
+        Run detection on overlapping model-sized tiles of a large image, see `tiling.detect_tiled_columnar`
+        Args:
+            image (np.array or PIL.Image): image to run detections, arrays in `channel_order`
+            **kwargs: tile_size, overlap, full_image, batch_size, merge_iou and classes
+
+        Returns:
+            list: list of `Detection` objects in image coordinates
+        """
+        return self.detect_tiled_columnar(image, **kwargs).to_detections()
+
+    def detect_tiled_columnar(self, image, **kwargs):
+        """
+        Same as `detect_tiled`, returning a `DetectionBatch`
+        """
+        from .tiling import detect_tiled_columnar
+        return detect_tiled_columnar(self, image, **kwargs)
+
+    def _to_detection_batches(self, outputs, image_shapes):
+        """
+        Convert `_run` outputs to one `DetectionBatch` per image, boxes rounded and clipped to their image
+        Args:
+            outputs (tuple): boxes, scores, classes and batch index from `_run`
+            image_shapes (list): (height, width) of every original image
+
+        Returns:
+            list: one `DetectionBatch` per image
+        """
+        start = timer()
+        out_boxes, out_scores, out_classes, out_batch_index = outputs
+        # Reversed, to keep the order `detect` has always returned.
+        out_boxes, out_scores = out_boxes[::-1], out_scores[::-1]
+        out_classes, out_batch_index = out_classes[::-1], out_batch_index[::-1]
+        image_shapes = np.asarray(image_shapes, dtype='float32').reshape(-1, 2)
+        boxes = np.floor(out_boxes + 0.5)  # top, left, bottom, right
+        boxes[:, :2] = np.maximum(boxes[:, :2], 0)
+        boxes[:, 2:] = np.minimum(boxes[:, 2:], image_shapes[out_batch_index])
+        boxes = boxes[:, [1, 0, 3, 2]].astype('int32')  # left, top, right, bottom
+        batches = []
+        for b in range(len(image_shapes)):
+            selected = out_batch_index == b
+            batches.append(DetectionBatch(boxes[selected], out_scores[selected], out_classes[selected],
+                                          self.class_names, self.colors))
+        self.metrics.inc('frames', len(image_shapes))
+        self.metrics.inc('boxes', len(out_scores))
+        self.metrics.observe('postprocess', timer() - start)
+        return batches
 
     @staticmethod
-    def draw_detections(img, detections):
+    def draw_detections(img, detections, in_place=False):
         """
         Draw detections to image
         Args:
             img: image to draw to
             detections: detections from predict() method
+            in_place (bool): draw on `img` itself (an np.array) instead of a copy
 
         Returns:
             np.array: image with bounding boxes and labels drawn
 
         """
+        from .render import default_renderer
         if not isinstance(img, np.ndarray):
             img = np.array(img)
-        img_draw = img.copy()
-        for det in detections:
-            x1, y1, x2, y2 = det.bbox
-            color = det.color
-            label = det.label
-            score = det.score
-            cv2.rectangle(img_draw, (x1, y1), (x2, y2), color, 3)
-            cv2.putText(img_draw,
-                        '{} {:.2f}%'.format(label, score * 100),
-                        (x1, y1 - 13),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        7e-4 * img_draw.shape[0],
-                        color,
-                        2)
-        return img_draw
+        return default_renderer().draw(img, detections, out=img if in_place else None)
 
     def close_session(self):
+        if self.registry is not None:
+            self.registry.release(self._registry_key)
+            # Models of every key share the process-wide Keras session, as do detectors
+            # without a registry: it is left to Keras unless nothing can be using it.
+            if len(self.registry) > 0 or self.sess is K.get_session():
+                return
         self.sess.close()
 
 
-def detect_video(yolo, video_path, output_path=""):
-    import cv2
-    vid = cv2.VideoCapture(video_path)
-    if not vid.isOpened():
-        raise IOError("Couldn't open webcam or video")
-    video_FourCC = int(vid.get(cv2.CAP_PROP_FOURCC))
-    video_fps = vid.get(cv2.CAP_PROP_FPS)
-    video_size = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                  int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-    isOutput = True if output_path != "" else False
-    if isOutput:
-        print("!!! TYPE:", type(output_path), type(video_FourCC), type(video_fps), type(video_size))
-        out = cv2.VideoWriter(output_path, video_FourCC, video_fps, video_size)
-    accum_time = 0
-    curr_fps = 0
-    fps = "FPS: ??"
-    prev_time = timer()
-    while True:
-        return_value, frame = vid.read()
-        image = Image.fromarray(frame)
-        image = yolo.detect_image(image)
-        result = np.asarray(image)
-        curr_time = timer()
-        exec_time = curr_time - prev_time
-        prev_time = curr_time
-        accum_time = accum_time + exec_time
-        curr_fps = curr_fps + 1
-        if accum_time > 1:
-            accum_time = accum_time - 1
-            fps = "FPS: " + str(curr_fps)
-            curr_fps = 0
-        cv2.putText(result, text=fps, org=(3, 15), fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                    fontScale=0.50, color=(255, 0, 0), thickness=2)
-        cv2.namedWindow("result", cv2.WINDOW_NORMAL)
-        cv2.imshow("result", result)
-        if isOutput:
-            out.write(result)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+def detect_video(yolo, video_path, output_path="", display=True, queue_size=8, backpressure='block',
+                 keyframe_interval=None, motion_threshold=None, max_staleness=30):
+    """
+    Detect objects on a video or webcam stream with a threaded capture/preprocess/inference/render pipeline
+    Args:
+        yolo (YOLO): detector
+        video_path: video file path or webcam id
+        output_path (str): (optional) annotated video to write
+        display (bool): show annotated frames in a window, False for headless file-to-file runs
+        queue_size (int): capacity of the queue between two stages
+        backpressure (str): 'block' to process every frame, 'drop_oldest' to keep up with live sources
+        keyframe_interval (int): (optional) run the detector on every n-th frame only and track in between
+        motion_threshold (float): (optional) reuse the previous detections while less than this fraction
+            of the frame changes, but for at most `max_staleness` frames
+
+    Returns:
+        dict: per-stage timing, see `VideoPipeline.run`
+    """
+    from .pipeline import VideoPipeline
+    motion_gate = None
+    if motion_threshold is not None:
+        from .motion import MotionGate
+        motion_gate = MotionGate(motion_threshold, max_staleness, metrics=yolo.metrics)
+    pipeline = VideoPipeline(yolo, video_path, output_path=output_path or None, display=display,
+                             queue_size=queue_size, backpressure=backpressure,
+                             keyframe_interval=keyframe_interval, motion_gate=motion_gate)
+    stats = pipeline.run()
     yolo.close_session()
+    return stats
 
 
 if __name__ == '__main__':
@@ -5,7 +5,7 @@ from functools import wraps
 import numpy as np
 import tensorflow as tf
 from keras import backend as K
-from keras.layers import Conv2D, Add, ZeroPadding2D, UpSampling2D, Concatenate, MaxPooling2D
+from keras.layers import Conv2D, Add, ZeroPadding2D, UpSampling2D, Concatenate, MaxPooling2D, Input
 from keras.layers.advanced_activations import LeakyReLU
 from keras.layers.normalization import BatchNormalization
 from keras.models import Model
@@ -23,7 +23,16 @@ def DarknetConv2D(*args, **kwargs):
     return Conv2D(*args, **darknet_conv_kwargs)
 
 def DarknetConv2D_BN_Leaky(*args, **kwargs):
-    """Darknet Convolution2D followed by BatchNormalization and LeakyReLU."""
+    """Darknet Convolution2D followed by BatchNormalization and LeakyReLU.
+
+    With fused=True the BatchNormalization is left out and the convolution has
+    a bias instead, to receive weights folded by `fold_batch_norms`.
+    """
+    fused = kwargs.pop('fused', False)
+    if fused:
+        return compose(
+            DarknetConv2D(*args, **dict(kwargs, use_bias=True)),
+            LeakyReLU(alpha=0.1))
     no_bias_kwargs = {'use_bias': False}
     no_bias_kwargs.update(kwargs)
     return compose(
@@ -31,94 +40,163 @@ def DarknetConv2D_BN_Leaky(*args, **kwargs):
         BatchNormalization(),
         LeakyReLU(alpha=0.1))
 
-def resblock_body(x, num_filters, num_blocks):
+def resblock_body(x, num_filters, num_blocks, fused=False):
     '''A series of resblocks starting with a downsampling Convolution2D'''
     # Darknet uses left and top padding instead of 'same' mode
     x = ZeroPadding2D(((1,0),(1,0)))(x)
-    x = DarknetConv2D_BN_Leaky(num_filters, (3,3), strides=(2,2))(x)
+    x = DarknetConv2D_BN_Leaky(num_filters, (3,3), strides=(2,2), fused=fused)(x)
     for i in range(num_blocks):
         y = compose(
-                DarknetConv2D_BN_Leaky(num_filters//2, (1,1)),
-                DarknetConv2D_BN_Leaky(num_filters, (3,3)))(x)
+                DarknetConv2D_BN_Leaky(num_filters//2, (1,1), fused=fused),
+                DarknetConv2D_BN_Leaky(num_filters, (3,3), fused=fused))(x)
         x = Add()([x,y])
     return x
 
-def darknet_body(x):
+def darknet_body(x, fused=False):
     '''Darknent body having 52 Convolution2D layers'''
-    x = DarknetConv2D_BN_Leaky(32, (3,3))(x)
-    x = resblock_body(x, 64, 1)
-    x = resblock_body(x, 128, 2)
-    x = resblock_body(x, 256, 8)
-    x = resblock_body(x, 512, 8)
-    x = resblock_body(x, 1024, 4)
+    x = DarknetConv2D_BN_Leaky(32, (3,3), fused=fused)(x)
+    x = resblock_body(x, 64, 1, fused)
+    x = resblock_body(x, 128, 2, fused)
+    x = resblock_body(x, 256, 8, fused)
+    x = resblock_body(x, 512, 8, fused)
+    x = resblock_body(x, 1024, 4, fused)
     return x
 
-def make_last_layers(x, num_filters, out_filters):
+def make_last_layers(x, num_filters, out_filters, fused=False):
     '''6 Conv2D_BN_Leaky layers followed by a Conv2D_linear layer'''
     x = compose(
-            DarknetConv2D_BN_Leaky(num_filters, (1,1)),
-            DarknetConv2D_BN_Leaky(num_filters*2, (3,3)),
-            DarknetConv2D_BN_Leaky(num_filters, (1,1)),
-            DarknetConv2D_BN_Leaky(num_filters*2, (3,3)),
-            DarknetConv2D_BN_Leaky(num_filters, (1,1)))(x)
+            DarknetConv2D_BN_Leaky(num_filters, (1,1), fused=fused),
+            DarknetConv2D_BN_Leaky(num_filters*2, (3,3), fused=fused),
+            DarknetConv2D_BN_Leaky(num_filters, (1,1), fused=fused),
+            DarknetConv2D_BN_Leaky(num_filters*2, (3,3), fused=fused),
+            DarknetConv2D_BN_Leaky(num_filters, (1,1), fused=fused))(x)
     y = compose(
-            DarknetConv2D_BN_Leaky(num_filters*2, (3,3)),
+            DarknetConv2D_BN_Leaky(num_filters*2, (3,3), fused=fused),
             DarknetConv2D(out_filters, (1,1)))(x)
     return x, y
 
 
-def yolo_body(inputs, num_anchors, num_classes):
+def yolo_body(inputs, num_anchors, num_classes, fused=False):
     """Create YOLO_V3 model CNN body in Keras."""
-    darknet = Model(inputs, darknet_body(inputs))
-    x, y1 = make_last_layers(darknet.output, 512, num_anchors*(num_classes+5))
+    darknet = Model(inputs, darknet_body(inputs, fused))
+    # The 256 and 512 filter stages end with the 11th and 19th Add, layers 92 and 152 of the unfused body.
+    adds = [layer for layer in darknet.layers if isinstance(layer, Add)]
+    x, y1 = make_last_layers(darknet.output, 512, num_anchors*(num_classes+5), fused)
 
     x = compose(
-            DarknetConv2D_BN_Leaky(256, (1,1)),
+            DarknetConv2D_BN_Leaky(256, (1,1), fused=fused),
             UpSampling2D(2))(x)
-    x = Concatenate()([x,darknet.layers[152].output])
-    x, y2 = make_last_layers(x, 256, num_anchors*(num_classes+5))
+    x = Concatenate()([x,adds[18].output])
+    x, y2 = make_last_layers(x, 256, num_anchors*(num_classes+5), fused)
 
     x = compose(
-            DarknetConv2D_BN_Leaky(128, (1,1)),
+            DarknetConv2D_BN_Leaky(128, (1,1), fused=fused),
             UpSampling2D(2))(x)
-    x = Concatenate()([x,darknet.layers[92].output])
-    x, y3 = make_last_layers(x, 128, num_anchors*(num_classes+5))
+    x = Concatenate()([x,adds[10].output])
+    x, y3 = make_last_layers(x, 128, num_anchors*(num_classes+5), fused)
 
     return Model(inputs, [y1,y2,y3])
 
-def tiny_yolo_body(inputs, num_anchors, num_classes):
+def tiny_yolo_body(inputs, num_anchors, num_classes, fused=False):
     '''Create Tiny YOLO_v3 model CNN body in keras.'''
     x1 = compose(
-            DarknetConv2D_BN_Leaky(16, (3,3)),
+            DarknetConv2D_BN_Leaky(16, (3,3), fused=fused),
             MaxPooling2D(pool_size=(2,2), strides=(2,2), padding='same'),
-            DarknetConv2D_BN_Leaky(32, (3,3)),
+            DarknetConv2D_BN_Leaky(32, (3,3), fused=fused),
             MaxPooling2D(pool_size=(2,2), strides=(2,2), padding='same'),
-            DarknetConv2D_BN_Leaky(64, (3,3)),
+            DarknetConv2D_BN_Leaky(64, (3,3), fused=fused),
             MaxPooling2D(pool_size=(2,2), strides=(2,2), padding='same'),
-            DarknetConv2D_BN_Leaky(128, (3,3)),
+            DarknetConv2D_BN_Leaky(128, (3,3), fused=fused),
             MaxPooling2D(pool_size=(2,2), strides=(2,2), padding='same'),
-            DarknetConv2D_BN_Leaky(256, (3,3)))(inputs)
+            DarknetConv2D_BN_Leaky(256, (3,3), fused=fused))(inputs)
     x2 = compose(
             MaxPooling2D(pool_size=(2,2), strides=(2,2), padding='same'),
-            DarknetConv2D_BN_Leaky(512, (3,3)),
+            DarknetConv2D_BN_Leaky(512, (3,3), fused=fused),
             MaxPooling2D(pool_size=(2,2), strides=(1,1), padding='same'),
-            DarknetConv2D_BN_Leaky(1024, (3,3)),
-            DarknetConv2D_BN_Leaky(256, (1,1)))(x1)
+            DarknetConv2D_BN_Leaky(1024, (3,3), fused=fused),
+            DarknetConv2D_BN_Leaky(256, (1,1), fused=fused))(x1)
     y1 = compose(
-            DarknetConv2D_BN_Leaky(512, (3,3)),
+            DarknetConv2D_BN_Leaky(512, (3,3), fused=fused),
             DarknetConv2D(num_anchors*(num_classes+5), (1,1)))(x2)
 
     x2 = compose(
-            DarknetConv2D_BN_Leaky(128, (1,1)),
+            DarknetConv2D_BN_Leaky(128, (1,1), fused=fused),
             UpSampling2D(2))(x2)
     y2 = compose(
             Concatenate(),
-            DarknetConv2D_BN_Leaky(256, (3,3)),
+            DarknetConv2D_BN_Leaky(256, (3,3), fused=fused),
             DarknetConv2D(num_anchors*(num_classes+5), (1,1)))([x2,x1])
 
     return Model(inputs, [y1,y2])
 
 
+def fold_batch_norms(model, num_anchors, num_classes):
+    """Inference copy of a YOLO body with every BatchNormalization folded into its convolution.
+
+    Parameters
+    ----------
+    model: Model, built by yolo_body or tiny_yolo_body, with weights loaded
+    num_anchors: integer, anchors per scale
+    num_classes: integer
+
+    Returns
+    -------
+    fused_model: Model, Conv2D (with bias) + LeakyReLU only, same inputs and outputs
+
+    For y = gamma * (conv(x) - mean) / sqrt(var + eps) + beta, the folded
+    convolution has kernel * gamma / sqrt(var + eps) and bias beta - mean * gamma / sqrt(var + eps).
+    """
+    body = tiny_yolo_body if len(model.output) == 2 else yolo_body
+    fused_model = body(Input(shape=model.input_shape[1:]), num_anchors, num_classes, fused=True)
+    convs = [layer for layer in model.layers if isinstance(layer, Conv2D)]
+    fused_convs = [layer for layer in fused_model.layers if isinstance(layer, Conv2D)]
+    assert len(convs) == len(fused_convs), 'Model does not match the YOLO body'
+    weight_values = []
+    for conv, fused_conv in zip(convs, fused_convs):
+        consumer = conv._outbound_nodes[0].outbound_layer
+        if isinstance(consumer, BatchNormalization):
+            kernel, = conv.get_weights()
+            gamma, beta, mean, variance = consumer.get_weights()
+            scale = gamma / np.sqrt(variance + consumer.epsilon)
+            weights = [kernel * scale, beta - mean * scale]
+        else:
+            weights = conv.get_weights()
+        weight_values.extend(zip(fused_conv.weights, weights))
+    K.batch_set_value(weight_values)
+    return fused_model
+
+
+def cast_body(model, num_anchors, num_classes, dtype='float16', weights=None):
+    """Copy of a YOLO body computing in another float type, e.g. float16.
+
+    Parameters
+    ----------
+    model: Model, built by yolo_body or tiny_yolo_body (folded or not), with weights loaded
+    num_anchors: integer, anchors per scale
+    num_classes: integer
+    dtype: string, type of the input, weights and activations of the copy
+    weights: list of arrays, (optional) values of model.get_weights(), taken
+        before hand when model lives in another graph
+
+    Returns
+    -------
+    cast_model: Model, same architecture; its outputs are of type dtype too
+    """
+    body = tiny_yolo_body if len(model.output) == 2 else yolo_body
+    fused = not any(isinstance(layer, BatchNormalization) for layer in model.layers)
+    floatx = K.floatx()
+    K.set_floatx(dtype)
+    try:
+        cast_model = body(Input(shape=model.input_shape[1:], dtype=dtype), num_anchors, num_classes, fused=fused)
+    finally:
+        K.set_floatx(floatx)
+    # Layer by layer, like get_weights; `weights` lists trainable ones first.
+    if weights is None:
+        weights = model.get_weights()
+    cast_model.set_weights([value.astype(dtype) for value in weights])
+    return cast_model
+
+
 def yolo_head(feats, anchors, num_classes, input_shape, calc_loss=False):
     """Convert final layer features to bounding box parameters."""
     num_anchors = len(anchors)
@@ -153,7 +231,10 @@ def yolo_correct_boxes(box_xy, box_wh, input_shape, image_shape):
     box_hw = box_wh[..., ::-1]
     input_shape = K.cast(input_shape, K.dtype(box_yx))
     image_shape = K.cast(image_shape, K.dtype(box_yx))
-    new_shape = K.round(image_shape * K.min(input_shape/image_shape))
+    if K.ndim(image_shape) == 2:
+        # One (height, width) row per image, broadcast over grid and anchors.
+        image_shape = K.reshape(image_shape, [-1, 1, 1, 1, 2])
+    new_shape = K.round(image_shape * K.min(input_shape/image_shape, axis=-1, keepdims=True))
     offset = (input_shape-new_shape)/2./input_shape
     scale = input_shape/new_shape
     box_yx = (box_yx - offset) * scale
@@ -184,48 +265,165 @@ def yolo_boxes_and_scores(feats, anchors, num_classes, input_shape, image_shape)
     return boxes, box_scores
 
 
+def rank_in_group(groups):
+    """Position of every entry among the earlier entries of its group.
+
+    Parameters
+    ----------
+    groups: tensor of int32, shape=(n,), e.g. the image of every box in score order
+
+    Returns
+    -------
+    rank: tensor of int32, shape=(n,), 0 for the first entry of every group
+    """
+    order = tf.argsort(groups, stable=True)
+    sorted_groups = K.gather(groups, order)
+    first = tf.searchsorted(sorted_groups, sorted_groups, side='left', out_type=tf.int32)
+    rank = tf.range(K.shape(groups)[0]) - first
+    return tf.scatter_nd(K.expand_dims(order, -1), rank, K.shape(groups))
+
+
 def yolo_eval(yolo_outputs,
               anchors,
               num_classes,
               image_shape,
               max_boxes=20,
               score_threshold=.6,
-              iou_threshold=.5):
-    """Evaluate YOLO model on given input and return filtered boxes."""
+              iou_threshold=.5,
+              nms_mode='per_class',
+              pre_nms_top_k=1000,
+              class_mask=None):
+    """Evaluate YOLO model on given input and return filtered boxes.
+
+    `max_boxes`, `score_threshold` and `iou_threshold` may be scalar tensors
+    as well as numbers, so that they can be fed at run time. `class_mask`, a
+    (num_classes,) tensor, keeps only the classes where it is positive; the
+    others are dropped with the low scoring boxes, before any NMS work.
+
+    `image_shape` is either a single (height, width) pair shared by the whole
+    batch, or a (batch, 2) tensor with one row per image. In the latter case a
+    fourth tensor holding the batch index of every returned box is returned,
+    and `max_boxes` is applied per image and class, so that every image gets
+    the boxes it would get on its own.
+
+    `nms_mode` selects how non-max suppression is built:
+    'per_class' runs one NMS subgraph per class; 'offset' shifts every class
+    into its own coordinate range and runs a single NMS over the
+    `pre_nms_top_k` highest scoring (box, class) candidates, returning at most
+    `max_boxes` boxes per class on average instead of per class. In batched
+    mode the candidates are the `pre_nms_top_k` times batch size highest
+    scoring ones of the whole batch.
+    """
+    assert nms_mode in ('per_class', 'offset'), 'Unknown nms_mode {}'.format(nms_mode)
     num_layers = len(yolo_outputs)
     anchor_mask = [[6,7,8], [3,4,5], [0,1,2]] if num_layers==3 else [[3,4,5], [1,2,3]] # default setting
     input_shape = K.shape(yolo_outputs[0])[1:3] * 32
+    batched = K.ndim(image_shape) == 2
     boxes = []
     box_scores = []
+    batch_index = []
     for l in range(num_layers):
         _boxes, _box_scores = yolo_boxes_and_scores(yolo_outputs[l],
             anchors[anchor_mask[l]], num_classes, input_shape, image_shape)
         boxes.append(_boxes)
         box_scores.append(_box_scores)
+        if batched:
+            feats_shape = tf.shape(yolo_outputs[l])
+            boxes_per_image = feats_shape[1] * feats_shape[2] * len(anchor_mask[l])
+            batch_index.append(K.flatten(tf.tile(
+                K.expand_dims(tf.range(feats_shape[0]), -1), [1, boxes_per_image])))
     boxes = K.concatenate(boxes, axis=0)
     box_scores = K.concatenate(box_scores, axis=0)
 
     mask = box_scores >= score_threshold
-    max_boxes_tensor = K.constant(max_boxes, dtype='int32')
+    if class_mask is not None:
+        mask = tf.logical_and(mask, class_mask > 0)
+    max_boxes_tensor = K.cast(max_boxes, 'int32')
+    nms_boxes = boxes
+    if batched:
+        batch_index = K.concatenate(batch_index, axis=0)
+        # Shift every image into its own coordinate range so that a single
+        # NMS call per class never suppresses boxes across images.
+        span = K.max(boxes) - K.min(boxes) + 1.
+        nms_boxes = boxes + K.expand_dims(K.cast(batch_index, K.dtype(boxes)) * span, -1)
+
+    if nms_mode == 'offset':
+        # Every (box, class) pair above the threshold is a candidate.
+        candidates = tf.where(mask)
+        candidate_scores = tf.gather_nd(box_scores, candidates)
+        if batched:
+            pre_nms_top_k *= K.shape(image_shape)[0]
+        top_k = K.minimum(pre_nms_top_k, K.shape(candidate_scores)[0])
+        candidate_scores, top_index = tf.nn.top_k(candidate_scores, k=top_k)
+        candidates = K.gather(candidates, top_index)
+        box_index = candidates[:, 0]
+        classes_ = K.cast(candidates[:, 1], 'int32')
+        # Shift every class into its own coordinate range, past all images.
+        span = K.max(nms_boxes) - K.min(nms_boxes) + 1.
+        candidate_nms_boxes = K.gather(nms_boxes, box_index) + \
+            K.expand_dims(K.cast(classes_, K.dtype(boxes)) * span, -1)
+        max_output_size = max_boxes_tensor * num_classes
+        if batched:
+            # Nothing is capped across images: NMS keeps all, then every image keeps its best.
+            max_output_size = top_k
+        nms_index = tf.image.non_max_suppression(
+            candidate_nms_boxes, candidate_scores, max_output_size,
+            iou_threshold=iou_threshold)
+        if batched:
+            image_index = K.gather(batch_index, K.gather(box_index, nms_index))
+            nms_index = tf.boolean_mask(
+                nms_index, rank_in_group(image_index) < max_boxes_tensor * num_classes)
+        box_index = K.gather(box_index, nms_index)
+        boxes_ = K.gather(boxes, box_index)
+        scores_ = K.gather(candidate_scores, nms_index)
+        classes_ = K.gather(classes_, nms_index)
+        if batched:
+            return boxes_, scores_, classes_, K.gather(batch_index, box_index)
+        return boxes_, scores_, classes_
+
+    # Keep only the boxes some class passes, so that the per class masks
+    # below run over a handful of rows instead of every anchor.
+    candidates = K.any(mask, axis=1)
+    boxes = tf.boolean_mask(boxes, candidates)
+    box_scores = tf.boolean_mask(box_scores, candidates)
+    nms_boxes = tf.boolean_mask(nms_boxes, candidates)
+    mask = tf.boolean_mask(mask, candidates)
+    if batched:
+        batch_index = tf.boolean_mask(batch_index, candidates)
+
     boxes_ = []
     scores_ = []
     classes_ = []
+    batch_index_ = []
     for c in range(num_classes):
         # TODO: use keras backend instead of tf.
         class_boxes = tf.boolean_mask(boxes, mask[:, c])
         class_box_scores = tf.boolean_mask(box_scores[:, c], mask[:, c])
+        max_output_size = max_boxes_tensor
+        if batched:
+            # Nothing is capped across images: NMS keeps all, then every image keeps its best.
+            class_batch_index = tf.boolean_mask(batch_index, mask[:, c])
+            max_output_size = K.shape(class_box_scores)[0]
         nms_index = tf.image.non_max_suppression(
-            class_boxes, class_box_scores, max_boxes_tensor, iou_threshold=iou_threshold)
+            tf.boolean_mask(nms_boxes, mask[:, c]), class_box_scores, max_output_size,
+            iou_threshold=iou_threshold)
+        if batched:
+            nms_index = tf.boolean_mask(
+                nms_index, rank_in_group(K.gather(class_batch_index, nms_index)) < max_boxes_tensor)
         class_boxes = K.gather(class_boxes, nms_index)
         class_box_scores = K.gather(class_box_scores, nms_index)
         classes = K.ones_like(class_box_scores, 'int32') * c
         boxes_.append(class_boxes)
         scores_.append(class_box_scores)
         classes_.append(classes)
+        if batched:
+            batch_index_.append(K.gather(class_batch_index, nms_index))
     boxes_ = K.concatenate(boxes_, axis=0)
     scores_ = K.concatenate(scores_, axis=0)
     classes_ = K.concatenate(classes_, axis=0)
 
+    if batched:
+        return boxes_, scores_, classes_, K.concatenate(batch_index_, axis=0)
     return boxes_, scores_, classes_
 
 
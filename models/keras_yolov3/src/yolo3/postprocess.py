@@ -0,0 +1,126 @@
+"""NumPy decoding and NMS of raw YOLO head outputs, mirroring `yolo_eval` on the host."""
+
+import numpy as np
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def non_max_suppression(boxes, scores, iou_threshold, max_output_size=None):
+    '''Greedy NMS with the semantics of tf.image.non_max_suppression
+
+    Parameters
+    ----------
+    boxes: array, shape=(n, 4), y_min, x_min, y_max, x_max
+    scores: array, shape=(n,)
+    iou_threshold: float, boxes overlapping a kept box by more than this are dropped
+    max_output_size: integer or None
+
+    Returns
+    -------
+    keep: array of int, indices of kept boxes in decreasing score order
+
+    '''
+    order = np.argsort(-scores, kind='stable')
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if max_output_size is not None and len(keep) >= max_output_size:
+            break
+        rest = order[1:]
+        y_min = np.maximum(boxes[i, 0], boxes[rest, 0])
+        x_min = np.maximum(boxes[i, 1], boxes[rest, 1])
+        y_max = np.minimum(boxes[i, 2], boxes[rest, 2])
+        x_max = np.minimum(boxes[i, 3], boxes[rest, 3])
+        intersection = np.maximum(y_max - y_min, 0.) * np.maximum(x_max - x_min, 0.)
+        iou = intersection / (areas[i] + areas[rest] - intersection)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype='int64')
+
+
+def yolo_decode(feats, anchors, num_classes, input_shape, image_shape, score_threshold, class_mask=None):
+    '''Decode one head output of one image, rejecting low objectness first
+
+    Parameters
+    ----------
+    feats: array, shape=(grid_h, grid_w, num_anchors*(num_classes+5)), raw head output
+    anchors: array, shape=(num_anchors, 2), wh
+    input_shape: (height, width) fed to the model
+    image_shape: (height, width) of the original image
+    class_mask: array of bool, shape=(num_classes,), classes to keep, or None for all
+
+    Returns
+    -------
+    boxes: array, shape=(k, 4), y_min, x_min, y_max, x_max in image pixels
+    scores: array, shape=(k,)
+    classes: array of int32, shape=(k,)
+
+    '''
+    num_anchors = len(anchors)
+    grid_h, grid_w = feats.shape[:2]
+    feats = feats.reshape(grid_h, grid_w, num_anchors, num_classes + 5)
+
+    # score = confidence * class_prob <= confidence, so a box whose objectness
+    # is below the threshold can never pass it: compare logits, skip the rest.
+    logit_threshold = np.log(score_threshold / (1. - score_threshold))
+    grid_y, grid_x, anchor = np.nonzero(feats[..., 4] >= logit_threshold)
+    feats = feats[grid_y, grid_x, anchor]
+
+    box_scores = sigmoid(feats[:, 4:5]) * sigmoid(feats[:, 5:])
+    if class_mask is not None:
+        box_scores[:, ~class_mask] = 0.
+    box_index, classes = np.nonzero(box_scores >= score_threshold)
+    scores = box_scores[box_index, classes]
+    feats = feats[box_index]
+    grid = np.stack([grid_x[box_index], grid_y[box_index]], axis=-1)
+    anchor = anchor[box_index]
+
+    input_shape = np.array(input_shape, dtype='float32')
+    image_shape = np.array(image_shape, dtype='float32')
+    box_xy = (sigmoid(feats[:, :2]) + grid) / np.array([grid_w, grid_h], dtype='float32')
+    box_wh = np.exp(feats[:, 2:4]) * anchors[anchor] / input_shape[::-1]
+
+    # Same correction as yolo_correct_boxes.
+    new_shape = np.round(image_shape * np.min(input_shape / image_shape))
+    offset = (input_shape - new_shape) / 2. / input_shape
+    scale = input_shape / new_shape
+    box_yx = (box_xy[:, ::-1] - offset) * scale
+    box_hw = box_wh[:, ::-1] * scale
+    boxes = np.concatenate([box_yx - box_hw / 2., box_yx + box_hw / 2.], axis=-1)
+    boxes *= np.concatenate([image_shape, image_shape])
+    return boxes.astype('float32'), scores.astype('float32'), classes.astype('int32')
+
+
+def yolo_eval_numpy(yolo_outputs,
+                    anchors,
+                    num_classes,
+                    image_shape,
+                    max_boxes=20,
+                    score_threshold=.6,
+                    iou_threshold=.5,
+                    class_mask=None):
+    """Host-side equivalent of `yolo_eval` (per_class mode) for a single image.
+
+    `yolo_outputs` are the raw head outputs of one image, without batch axis.
+    Boxes are returned grouped by class, each class in decreasing score order.
+    """
+    num_layers = len(yolo_outputs)
+    anchor_mask = [[6,7,8], [3,4,5], [0,1,2]] if num_layers==3 else [[3,4,5], [1,2,3]] # default setting
+    input_shape = (yolo_outputs[0].shape[0] * 32, yolo_outputs[0].shape[1] * 32)
+    decoded = [yolo_decode(yolo_outputs[l], anchors[anchor_mask[l]], num_classes,
+                           input_shape, image_shape, score_threshold, class_mask) for l in range(num_layers)]
+    boxes, scores, classes = [np.concatenate(d) for d in zip(*decoded)]
+    if len(boxes) == 0:
+        return boxes, scores, classes
+
+    # Shift every class into its own coordinate range: one NMS pass equals per class NMS.
+    span = boxes.max() - boxes.min() + 1.
+    keep = non_max_suppression(boxes + classes[:, None] * span, scores, iou_threshold)
+    keep = keep[np.lexsort((-scores[keep], classes[keep]))]
+    # NMS in score order then a per class cap equals capping each class NMS.
+    rank = np.arange(len(keep)) - np.searchsorted(classes[keep], classes[keep])
+    keep = keep[rank < max_boxes]
+    return boxes[keep], scores[keep], classes[keep]
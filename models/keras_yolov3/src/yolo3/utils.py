@@ -4,7 +4,6 @@ from functools import reduce
 
 from PIL import Image
 import numpy as np
-from matplotlib.colors import rgb_to_hsv, hsv_to_rgb
 
 def compose(*funcs):
     """Compose arbitrarily many functions, evaluated left to right.
@@ -30,11 +29,62 @@ def letterbox_image(image, size):
     new_image.paste(image, ((w-nw)//2, (h-nh)//2))
     return new_image
 
+INTERPOLATIONS = {
+    'nearest': 'INTER_NEAREST',
+    'linear': 'INTER_LINEAR',
+    'area': 'INTER_AREA',
+    'cubic': 'INTER_CUBIC',
+}
+
+def letterbox_array(image, size, out=None, interpolation='cubic', swap_rb=False):
+    """Letterbox a uint8 HxWx3 array straight into a float32 [0, 1] buffer.
+
+    Grayscale (HxW or HxWx1) arrays are expanded to three channels and the
+    alpha channel of HxWx4 arrays is dropped, as `letterbox_image` does.
+
+    NumPy/cv2 counterpart of `letterbox_image`: the resized frame and the grey
+    padding are written into `out` (allocated when None), so a caller that
+    keeps `out` around does no full-frame allocation besides the resize.
+    Set `swap_rb` to convert BGR frames (as read by cv2) to RGB on the fly.
+    """
+    import cv2
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    if channels not in (1, 3, 4):
+        raise ValueError('Expected a grayscale, 3 or 4 channel image, got shape {}'.format(image.shape))
+    ih, iw = image.shape[:2]
+    w, h = size
+    scale = min(w/iw, h/ih)
+    nw = int(iw*scale)
+    nh = int(ih*scale)
+    dx = (w-nw)//2
+    dy = (h-nh)//2
+
+    if out is None:
+        out = np.empty((h, w, 3), dtype='float32')
+    if (nw, nh) != (iw, ih):
+        image = cv2.resize(image, (nw, nh), interpolation=getattr(cv2, INTERPOLATIONS[interpolation]))
+    if channels == 1:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    elif channels == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)  # keeps the channel order, BGRA included
+    if swap_rb:
+        image = image[..., ::-1]
+
+    grey = np.float32(128/255.)
+    out[:dy] = grey
+    out[dy+nh:] = grey
+    out[dy:dy+nh, :dx] = grey
+    out[dy:dy+nh, dx+nw:] = grey
+    np.multiply(image, np.float32(1/255.), out=out[dy:dy+nh, dx:dx+nw])
+    return out
+
+
 def rand(a=0, b=1):
     return np.random.rand()*(b-a) + a
 
 def get_random_data(annotation_line, input_shape, random=True, max_boxes=20, jitter=.3, hue=.1, sat=1.5, val=1.5, proc_img=True):
     '''random preprocessing for real-time data augmentation'''
+    from matplotlib.colors import rgb_to_hsv, hsv_to_rgb
     line = annotation_line.split()
     image = Image.open(line[0])
     iw, ih = image.size
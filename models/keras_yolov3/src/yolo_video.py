@@ -44,6 +44,11 @@ if __name__ == '__main__':
         help='Number of GPU to use, default ' + str(YOLO.get_defaults("gpu_num"))
     )
 
+    parser.add_argument(
+        '--latency_budget', type=float,
+        help='Target seconds per frame; adapts the input resolution to meet it, default disabled'
+    )
+
     parser.add_argument(
         '--image', default=False, action="store_true",
         help='Image detection mode, will ignore all positional arguments'
@@ -61,6 +66,21 @@ if __name__ == '__main__':
         help = "[Optional] Video output path"
     )
 
+    parser.add_argument(
+        "--headless", default=False, action="store_true",
+        help = "[Optional] Do not display frames, e.g. for file to file processing"
+    )
+
+    parser.add_argument(
+        "--keyframe_interval", nargs='?', type=int, default=None,
+        help = "[Optional] Run the detector on every n-th frame only and track boxes in between"
+    )
+
+    parser.add_argument(
+        "--motion_threshold", nargs='?', type=float, default=None,
+        help = "[Optional] Reuse the previous detections while less than this fraction of the frame changes"
+    )
+
     FLAGS = parser.parse_args()
 
     if FLAGS.image:
@@ -72,6 +92,9 @@ if __name__ == '__main__':
             print(" Ignoring remaining command line arguments: " + FLAGS.input + "," + FLAGS.output)
         detect_img(YOLO(**vars(FLAGS)))
     elif "input" in FLAGS:
-        detect_video(YOLO(**vars(FLAGS)), int(FLAGS.input), FLAGS.output)
+        source = int(FLAGS.input) if FLAGS.input.isdigit() else FLAGS.input
+        print(detect_video(YOLO(**vars(FLAGS)), source, FLAGS.output, display=not FLAGS.headless,
+                           keyframe_interval=FLAGS.keyframe_interval,
+                           motion_threshold=FLAGS.motion_threshold))
     else:
         print("Must specify at least video_input_path.  See usage with --help.")
@@ -3,12 +3,10 @@ import re
 import io
 import glob
 import logging
-import requests
 from tqdm import tqdm
 import numpy as np
 import cv2
 from PIL import Image
-from tensorflow.python.lib.io import file_io
 
 LOGGER = logging.getLogger(__name__)
 
@@ -17,6 +15,7 @@ def is_downloadable(url):
     """
     Does the url contain a downloadable resource
     """
+    import requests
     h = requests.head(url, allow_redirects=True)
     header = h.headers
     content_type = header.get('content-type')
@@ -50,6 +49,7 @@ def download_image(url, save_to=None):
     Returns:
         numpy.ndarray: Image as numpy array
     """
+    import requests
     if not is_downloadable(url=url):
         msg = 'url {} not downloadable'.format(url)
         LOGGER.error(msg)
@@ -90,6 +90,7 @@ def load_image_from_gcs(filename: str) -> np.array:
     Returns:
 
     """
+    from tensorflow.python.lib.io import file_io  # deferred: only needed for GCS
     try:
         with file_io.FileIO(filename, 'rb') as gf:  # tensorflow file_io takes care of GCS file loading
             image_bytes = gf.read()
@@ -130,6 +131,7 @@ def get_image_filenames(dirname):
     for dir in dirname:
         for ext in image_extensions:
             if is_gcs_location(dir):
+                from tensorflow.python.lib.io import file_io
                 files = file_io.get_matching_files(os.path.join(dir, '*.{}'.format(ext)))
             else:
                 files = glob.glob(os.path.join(dir, '*.{}'.format(ext)))
@@ -1,30 +1,59 @@
 """Webcam demo for YOLOv3"""
 import argparse
 import cv2
+import numpy as np
 from models.keras_yolov3 import YOLOV3
+from models.keras_yolov3.src.ringbuffer import FrameRing
+from models.keras_yolov3.src.tracker import KeyframeDetector
+from models.keras_yolov3.src.motion import MotionGate
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--cam-id', '-c', type=int, default=0, help='Webcam id (default=0)')
+    parser.add_argument('--keyframe-interval', '-k', type=int, default=1,
+                        help='Run the detector on every k-th frame and track boxes in between (default=1)')
+    parser.add_argument('--motion-threshold', '-m', type=float, default=None,
+                        help='Reuse the previous detections while less than this fraction of the frame '
+                             'changes (default: detect on every frame)')
+    parser.add_argument('--max-staleness', type=int, default=30,
+                        help='Frames previous detections may be reused for with --motion-threshold (default=30)')
     args = parser.parse_args()
     cam_id = args.cam_id
     vc = cv2.VideoCapture()
     if not vc.open(cam_id):
         raise IOError("Error opening webcam {}".format(cam_id))
 
-    detector = YOLOV3()
+    detector = YOLOV3(channel_order='bgr')
+    keyframes = KeyframeDetector(detector, interval=args.keyframe_interval)
+    gate = None
+    if args.motion_threshold is not None:
+        gate = MotionGate(args.motion_threshold, args.max_staleness, metrics=detector.metrics)
+    detections = []
+    # Sized from the first frame: not every backend reports the frame size it decodes.
+    ring, slot = FrameRing.from_capture(vc, 2)
+    img = np.empty((960, 1280, 3), dtype=np.uint8)  # display frame, reused every iteration
+    status = 0
     while True:
-        _, img = vc.read()
-        img = cv2.resize(img, (1280, 960))
-        detections = detector.detect(image=cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-        img_draw = detector.draw_detections(img, detections)
-        cv2.imshow("Detections", img_draw)
+        if slot is None:
+            print('Error reading from webcam {}'.format(cam_id))
+            status = 1
+            break
+        cv2.resize(ring.frames[slot], (1280, 960), dst=img)
+        ring.release(slot)
+        if gate is None or gate.check(img):
+            detections = keyframes.detect(img)
+        detector.draw_detections(img, detections, in_place=True)
+        cv2.imshow("Detections", img)
         key = cv2.waitKey(1)
         if key & 0xFFFF == 27:
-            vc.release()
-            cv2.destroyAllWindows()
-            exit(0)
+            break
+        slot = ring.read(vc)
+    if gate is not None:
+        print('Skipped {} of {} frames'.format(gate.skipped, gate.frames))
+    vc.release()
+    cv2.destroyAllWindows()
+    exit(status)
 
 
 if __name__ == '__main__':